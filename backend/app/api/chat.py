@@ -1,15 +1,45 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
 from fastapi import APIRouter, HTTPException, Request
-from pydantic import BaseModel
-from ..tasks.chroma_tasks import query_chroma
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Optional
+from ..services.queryChroma import query_chroma, query_chroma_batch, stream_query_chroma, NO_INFORMATION_ANSWER
+from ..services.queryChroma import DEFAULT_K, DEFAULT_FETCH_K, DEFAULT_LAMBDA_MULT
 from slowapi import Limiter
 from slowapi.util import get_remote_address
+from ..config import RATE_LIMITS_ENABLED, CHAT_QUERY_WORKERS, CHAT_BATCH_MAX_QUESTIONS
 
 router = APIRouter()
-limiter = Limiter(key_func=get_remote_address)
+limiter = Limiter(key_func=get_remote_address, enabled=RATE_LIMITS_ENABLED)
+
+# Chroma, embedding and LLM calls are blocking, so they run here instead of on the event loop
+query_executor = ThreadPoolExecutor(max_workers=CHAT_QUERY_WORKERS, thread_name_prefix="chat-query")
 
 class ChatRequest(BaseModel):
     question: str
     userId: str
+    # Retrieval tuning: number of chunks in the context, MMR candidate pool and relevance/diversity trade-off
+    k: int = Field(DEFAULT_K, ge=1, le=20)
+    fetchK: int = Field(DEFAULT_FETCH_K, ge=1, le=200)
+    lambdaMult: float = Field(DEFAULT_LAMBDA_MULT, ge=0.0, le=1.0)
+    # Only search the chunks of this uploaded document
+    documentId: Optional[str] = None
+
+class BatchChatRequest(BaseModel):
+    questions: list[str] = Field(..., min_length=1, max_length=CHAT_BATCH_MAX_QUESTIONS)
+    userId: str
+    k: int = Field(DEFAULT_K, ge=1, le=20)
+    fetchK: int = Field(DEFAULT_FETCH_K, ge=1, le=200)
+    lambdaMult: float = Field(DEFAULT_LAMBDA_MULT, ge=0.0, le=1.0)
+    documentId: Optional[str] = None
+
+def format_response(result: dict) -> dict:
+    return {
+        "response": result["answer"],
+        "sources": [] if result["answer"] == NO_INFORMATION_ANSWER else result["sources"],
+    }
     
 @router.post("/get-response")
 @limiter.limit("30/hour")
@@ -18,16 +48,80 @@ async def get_response(request: Request, chat_request: ChatRequest):
         if not chat_request.userId:
             return {"response": "Unable to process request", "sources": []}
         
-        result = query_chroma(chat_request.question, chat_request.userId)
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            query_executor,
+            query_chroma,
+            chat_request.question,
+            chat_request.userId,
+            chat_request.k,
+            chat_request.fetchK,
+            chat_request.lambdaMult,
+            chat_request.documentId,
+        )
+
+        return format_response(result)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        if result["answer"] == "I don't have enough information in the document to answer this question.":
-            sources = []
-        else:
-            sources = result["sources"]
+@router.post("/get-responses")
+@limiter.limit("10/hour")
+async def get_responses(request: Request, chat_request: BatchChatRequest):
+    """
+    Answer several questions in one request; responses come back in question order.
+    """
+    try:
+        if not chat_request.userId:
+            return {"responses": [{"response": "Unable to process request", "sources": []} for _ in chat_request.questions]}
 
-        return {
-            "response": result["answer"],
-            "sources": sources
-        }
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(
+            query_executor,
+            query_chroma_batch,
+            chat_request.questions,
+            chat_request.userId,
+            chat_request.k,
+            chat_request.fetchK,
+            chat_request.lambdaMult,
+            chat_request.documentId,
+        )
+        return {"responses": [format_response(result) for result in results]}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/stream-response")
+@limiter.limit("30/hour")
+async def stream_response(request: Request, chat_request: ChatRequest):
+    """
+    SSE endpoint that streams the retrieved sources, then the answer tokens as they are generated.
+    """
+    if not chat_request.userId:
+        raise HTTPException(status_code=400, detail="Unable to process request")
+
+    # The blocking generator is advanced on the bounded query pool, off the event loop
+    async def event_stream():
+        events = stream_query_chroma(
+            chat_request.question,
+            chat_request.userId,
+            chat_request.k,
+            chat_request.fetchK,
+            chat_request.lambdaMult,
+            chat_request.documentId,
+        )
+        step = None
+        try:
+            while True:
+                step = query_executor.submit(next, events, None)
+                event = await asyncio.wrap_future(step)
+                if event is None:
+                    break
+                yield f"data: {json.dumps(event)}\n\n"
+        finally:
+            # A client that disconnects mid-step leaves the generator running on the pool;
+            # it can only be closed once that step returns
+            if step is not None and not step.done():
+                step.add_done_callback(lambda _: query_executor.submit(events.close))
+            else:
+                query_executor.submit(events.close)
+
+    return StreamingResponse(event_stream(), media_type='text/event-stream')
@@ -1,15 +1,20 @@
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request, Depends
-from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 import uuid
-import redis
-import json
-from ..tasks.chroma_tasks import create_chroma_db, create_document_summary
+from ..tasks.chroma_tasks import start_document_processing
+from ..services.progress import publish_progress
+from .progressStream import progress_response
+from ..services.blobStore import BlobWriter, delete_blob
+from ..services.createChroma import delete_document
+from .uploadLimits import check_upload_size, check_pdf_pages, max_upload_bytes, TOO_LARGE_MESSAGE
 from slowapi import Limiter
 from slowapi.util import get_remote_address
+from ..config import RATE_LIMITS_ENABLED
 
-redis_client = redis.StrictRedis(host='localhost', port=6379, db=0)
 router = APIRouter()
-limiter = Limiter(key_func=get_remote_address)
+limiter = Limiter(key_func=get_remote_address, enabled=RATE_LIMITS_ENABLED)
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
 @router.post("/upload")
 @limiter.limit("10/hour")
@@ -22,16 +27,33 @@ async def upload_document(
         document_id = str(uuid.uuid4())
         task_id = str(uuid.uuid4())
 
-        # Read the file content into memory
-        content = await file.read()
-
         content_type = file.filename.split(".")[-1].lower()
         if content_type not in ['txt', 'md', 'pdf']:
             raise HTTPException(status_code=400, detail="Unsupported file type")
+        check_upload_size(content_type, file.size)
+
+        # Spool the file to the blob store in chunks; tasks only receive its reference
+        writer = BlobWriter()
+        try:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await run_in_threadpool(writer.write, chunk)
+                if writer.size > max_upload_bytes(content_type):
+                    raise HTTPException(status_code=413, detail=TOO_LARGE_MESSAGE)
+            blob_ref = await run_in_threadpool(writer.commit)
+        except Exception:
+            writer.discard()
+            raise
 
-        # Trigger Celery tasks with in-memory content
-        create_chroma_db.apply_async(args=[content, content_type, task_id, userId])
-        create_document_summary.apply_async(args=[content, content_type, task_id, userId])
+        if content_type == 'pdf':
+            try:
+                await check_pdf_pages(blob_ref)
+            except Exception:
+                # Rejected uploads would otherwise wait for the blob TTL purge
+                await run_in_threadpool(delete_blob, blob_ref)
+                raise
+
+        # Parse once, then create vectors and summary from the parsed document
+        start_document_processing(blob_ref, content_type, task_id, userId, document_id)
 
         return {
             "documentId": document_id,
@@ -40,22 +62,29 @@ async def upload_document(
             "taskId": task_id,
         }
 
+    except HTTPException:
+        raise
+    except Exception as e:
+        publish_progress(task_id, {"status": "error", "message": str(e)})
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/{document_id}")
+@limiter.limit("30/hour")
+async def remove_document(request: Request, document_id: str, userId: str):
+    """
+    Remove one uploaded document's chunks from the user's collection.
+    """
+    try:
+        deleted = await run_in_threadpool(delete_document, userId, document_id)
     except Exception as e:
-        redis_client.publish(f"progress_channel:{task_id}", 
-            json.dumps({"status": "error", "message": str(e)}))
         raise HTTPException(status_code=500, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"documentId": document_id, "userId": userId, "deletedChunks": deleted}
 
 @router.get("/progress/{task_id}")
-async def get_progress(task_id: str):
+async def get_progress(task_id: str, request: Request):
     """
     SSE endpoint that streams progress updates to the frontend.
     """
-    def event_stream():
-        pubsub = redis_client.pubsub()
-        pubsub.subscribe(f"progress_channel:{task_id}")
-        
-        for message in pubsub.listen():
-            if message['type'] == 'message':
-                yield f"data: {message['data'].decode()}\n\n"
-
-    return StreamingResponse(event_stream(), media_type='text/event-stream')
+    return progress_response(task_id, request)
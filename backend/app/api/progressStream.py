@@ -0,0 +1,145 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from ..clients import get_async_redis
+from ..services.progress import progress_stream_key, UploadCompletion
+
+KEEPALIVE_SECONDS = 15
+
+def _parse_event_id(event_id: str) -> tuple[int, int]:
+    milliseconds, _, sequence = event_id.partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+def _format_event(event_id: str, data: str) -> str:
+    return f"id: {event_id}\ndata: {data}\n\n"
+
+# Put on every live queue after the subscription is re-established, so each connection
+# re-reads the stream for anything published while it was down
+RESYNC = object()
+
+class ProgressHub:
+    """Single Redis pattern subscription per process, fanned out to per-task asyncio queues."""
+
+    def __init__(self):
+        self.queues: dict[str, set[asyncio.Queue]] = {}
+        self.listener: Optional[asyncio.Task] = None
+        # Set while the pattern subscription is confirmed by Redis
+        self.ready = asyncio.Event()
+
+    @property
+    def client(self):
+        return get_async_redis()
+
+    def _ensure_listener(self):
+        if self.listener is None or self.listener.done():
+            self.listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        reconnecting = False
+        while True:
+            try:
+                async with self.client.pubsub() as pubsub:
+                    await pubsub.psubscribe("progress_channel:*")
+                    async for message in pubsub.listen():
+                        if message["type"] == "psubscribe":
+                            if reconnecting:
+                                for subscribers in self.queues.values():
+                                    for queue in subscribers:
+                                        queue.put_nowait(RESYNC)
+                                reconnecting = False
+                            self.ready.set()
+                            continue
+                        if message["type"] != "pmessage":
+                            continue
+                        task_id = message["channel"].decode().split(":", 1)[1]
+                        for queue in self.queues.get(task_id, ()):
+                            queue.put_nowait(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                self.ready.clear()
+                raise
+            except Exception as e:
+                print(f"Progress subscriber error, reconnecting: {str(e)}")
+                self.ready.clear()
+                reconnecting = True
+                await asyncio.sleep(1)
+
+    @asynccontextmanager
+    async def subscribe(self, task_id: str) -> AsyncIterator[asyncio.Queue]:
+        """Register a queue for the task's live events, once the subscription is active."""
+        queue = asyncio.Queue()
+        self.queues.setdefault(task_id, set()).add(queue)
+        self._ensure_listener()
+        try:
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout=KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                # Redis is unreachable; the queue gets RESYNC once the subscription is back
+                pass
+            yield queue
+        finally:
+            subscribers = self.queues.get(task_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self.queues[task_id]
+
+    async def _history(self, task_id: str, after: Optional[str]) -> list[tuple[str, str]]:
+        """Events in the task's stream after the `after` id, or all of them."""
+        start = f"({after}" if after else "-"
+        return [
+            (event_id.decode(), fields[b"data"].decode())
+            for event_id, fields in await self.client.xrange(progress_stream_key(task_id), min=start)
+        ]
+
+    async def events(self, task_id: str, last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+        """SSE events for a task: replayed history first, then live events until the upload is complete."""
+        async with self.subscribe(task_id) as queue:
+            # The subscription is active by now, so anything published after the history
+            # read below arrives on the queue
+            completion = UploadCompletion()
+            last_id = last_event_id
+            last_seen = _parse_event_id(last_event_id) if last_event_id else (0, 0)
+            # The first read covers the whole stream, so a resumed connection still knows
+            # whether the vectors or the summary finished before its Last-Event-ID
+            after = None
+
+            while True:
+                for event_id, data in await self._history(task_id, after):
+                    done = completion.update(data)
+                    if _parse_event_id(event_id) > last_seen:
+                        last_id, last_seen = event_id, _parse_event_id(event_id)
+                        yield _format_event(event_id, data)
+                    if done:
+                        return
+                after = last_id
+
+                while True:
+                    try:
+                        event = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+                    except asyncio.TimeoutError:
+                        yield ": keepalive\n\n"
+                        continue
+
+                    if event is RESYNC:
+                        # Re-read the stream from the last event sent
+                        break
+                    if _parse_event_id(event["id"]) <= last_seen:
+                        continue
+                    last_id, last_seen = event["id"], _parse_event_id(event["id"])
+                    yield _format_event(event["id"], event["data"])
+                    if completion.update(event["data"]):
+                        return
+
+progress_hub = ProgressHub()
+
+def progress_response(task_id: str, request: Request) -> StreamingResponse:
+    """SSE response for a task's progress, resuming after the client's Last-Event-ID."""
+    last_event_id = request.headers.get("last-event-id")
+    try:
+        _parse_event_id(last_event_id or "0")
+    except ValueError:
+        last_event_id = None
+    return StreamingResponse(progress_hub.events(task_id, last_event_id), media_type='text/event-stream')
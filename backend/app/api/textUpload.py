@@ -1,16 +1,18 @@
 from fastapi import APIRouter, HTTPException, Request
-from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import uuid
-import redis
-import json
-from ..tasks.chroma_tasks import create_chroma_db, create_document_summary
+from ..tasks.chroma_tasks import start_document_processing
+from ..services.progress import publish_progress
+from .progressStream import progress_response
+from ..services.blobStore import put_blob
+from .uploadLimits import check_upload_size
 from slowapi import Limiter
 from slowapi.util import get_remote_address
+from ..config import RATE_LIMITS_ENABLED
 
 router = APIRouter()
-redis_client = redis.StrictRedis(host='localhost', port=6379, db=0)
-limiter = Limiter(key_func=get_remote_address)
+limiter = Limiter(key_func=get_remote_address, enabled=RATE_LIMITS_ENABLED)
 
 class TextRequest(BaseModel):
     content: str
@@ -23,12 +25,14 @@ async def upload_text(request: Request, text_request: TextRequest):
         document_id = str(uuid.uuid4())
         task_id = str(uuid.uuid4())
         
-        # Use the content string directly
-        content = text_request.content
+        content = text_request.content.encode('utf-8')
+        check_upload_size("txt", len(content))
+
+        # Spool the text to the blob store; tasks only receive its reference
+        blob_ref = await run_in_threadpool(put_blob, content)
         
-        # Trigger Celery tasks with in-memory content
-        create_chroma_db.apply_async(args=[content, "txt", task_id, text_request.userId])
-        create_document_summary.apply_async(args=[content, "txt", task_id, text_request.userId])
+        # Parse once, then create vectors and summary from the parsed document
+        start_document_processing(blob_ref, "txt", task_id, text_request.userId, document_id)
 
         return {
             "documentId": document_id,
@@ -36,23 +40,15 @@ async def upload_text(request: Request, text_request: TextRequest):
             "filename": f"{document_id}_text.txt",
             "taskId": task_id,
         }
+    except HTTPException:
+        raise
     except Exception as e:
-        redis_client.publish(f"progress_channel:{task_id}", 
-            json.dumps({"status": "error", "message": str(e)}))
+        publish_progress(task_id, {"status": "error", "message": str(e)})
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/progress/{task_id}")
-async def get_progress(task_id: str):
+async def get_progress(task_id: str, request: Request):
     """
     SSE endpoint that streams progress updates to the frontend.
     """
-    def event_stream():
-        pubsub = redis_client.pubsub()
-        pubsub.subscribe(f"progress_channel:{task_id}")
-        
-        for message in pubsub.listen():
-            if message['type'] == 'message':
-                
-                yield f"data: {message['data'].decode()}\n\n"
-
-    return StreamingResponse(event_stream(), media_type='text/event-stream')
+    return progress_response(task_id, request)
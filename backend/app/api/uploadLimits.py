@@ -0,0 +1,24 @@
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+from ..services.parseDocument import count_pdf_pages
+from ..config import MAX_UPLOAD_BYTES, MAX_TEXT_UPLOAD_BYTES, MAX_PDF_PAGES
+
+TOO_LARGE_MESSAGE = "Document is too large to process"
+
+def max_upload_bytes(file_type: str) -> int:
+    return MAX_UPLOAD_BYTES if file_type == 'pdf' else min(MAX_UPLOAD_BYTES, MAX_TEXT_UPLOAD_BYTES)
+
+def check_upload_size(file_type: str, size: Optional[int]):
+    """Reject uploads whose byte size alone rules them out."""
+    if size is not None and size > max_upload_bytes(file_type):
+        raise HTTPException(status_code=413, detail=TOO_LARGE_MESSAGE)
+
+async def check_pdf_pages(blob_ref: str):
+    """Reject PDFs with more pages than the token limit could ever fit."""
+    try:
+        num_pages = await run_in_threadpool(count_pdf_pages, blob_ref)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Could not read the PDF file")
+    if num_pages > MAX_PDF_PAGES:
+        raise HTTPException(status_code=413, detail=TOO_LARGE_MESSAGE)
@@ -0,0 +1,69 @@
+"""Shared service clients, created on first use and reused for the life of the process.
+
+Heavy client libraries (chromadb, langchain_openai) are imported inside the getters, so
+importing the API or the Celery app does not pay for them until a request needs them.
+"""
+import threading
+from functools import wraps
+from app.config import (
+    REDIS_URL,
+    REDIS_MAX_CONNECTIONS,
+    CHROMA_HOST,
+    CHROMA_PORT,
+    EMBEDDING_MODEL,
+    EMBEDDING_MODEL_DIMENSIONS,
+    EMBEDDING_DIMENSIONS,
+    LLM_MODEL,
+)
+
+_lock = threading.Lock()
+
+def lazy_client(factory):
+    """Build the client once per process, on the first call, even with concurrent callers."""
+    instance = None
+
+    @wraps(factory)
+    def get():
+        nonlocal instance
+        if instance is None:
+            with _lock:
+                if instance is None:
+                    instance = factory()
+        return instance
+
+    def override(client):
+        """Use `client` from now on, e.g. a local stand-in in benchmarks."""
+        nonlocal instance
+        instance = client
+
+    get.override = override
+    return get
+
+@lazy_client
+def get_redis():
+    import redis
+    # Callers wait for a free connection instead of failing when the pool is exhausted
+    pool = redis.BlockingConnectionPool.from_url(REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS, timeout=20)
+    return redis.StrictRedis(connection_pool=pool)
+
+@lazy_client
+def get_async_redis():
+    import redis.asyncio as aioredis
+    return aioredis.from_url(REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS)
+
+@lazy_client
+def get_chroma_client():
+    import chromadb
+    return chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+
+@lazy_client
+def get_embeddings():
+    from langchain_openai import OpenAIEmbeddings
+    # The API shortens and renormalizes text-embedding-3 vectors itself when asked for fewer dimensions
+    dimensions = EMBEDDING_DIMENSIONS if EMBEDDING_DIMENSIONS < EMBEDDING_MODEL_DIMENSIONS else None
+    return OpenAIEmbeddings(model=EMBEDDING_MODEL, dimensions=dimensions)
+
+@lazy_client
+def get_llm():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(temperature=0, model_name=LLM_MODEL)
@@ -1,5 +1,5 @@
 import os
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,5 +8,111 @@ api_key = os.environ.get('OPENAI_API_KEY')
 if not api_key:
     raise ValueError("OPENAI_API_KEY environment variable is not set or is empty")
 
-embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-llm = ChatOpenAI(temperature=0, model_name="gpt-4o-mini") 
+EMBEDDING_MODEL = "text-embedding-3-large"
+EMBEDDING_MODEL_DIMENSIONS = 3072
+LLM_MODEL = "gpt-4o-mini"
+
+# Shared service clients (see app/clients.py) - created on first use, one pool per process
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 64))
+CHROMA_HOST = os.environ.get('CHROMA_HOST', 'localhost')
+CHROMA_PORT = int(os.environ.get('CHROMA_PORT', 8000))
+
+# Embedding cache (Redis) - entries expire after TTL seconds without a hit. The cache shares Redis with the
+# Celery broker, so its size is capped in MB; least recently used embeddings are dropped beyond that.
+EMBEDDING_CACHE_TTL = int(os.environ.get('EMBEDDING_CACHE_TTL', 7 * 24 * 60 * 60))
+EMBEDDING_CACHE_MAX_MB = int(os.environ.get('EMBEDDING_CACHE_MAX_MB', 256))
+
+# Compact vector storage - Chroma holds every vector in RAM. Fewer EMBEDDING_DIMENSIONS are requested from the
+# model (Matryoshka embeddings keep most of their quality when shortened); Chroma indexes only the first
+# VECTOR_INDEX_DIMENSIONS of them. With RESCORE_PRECISION ("int8" or "float16"), a quantized copy of the
+# whole embedding is kept in Redis and RESCORE_OVERSAMPLING times more candidates are rescored with it.
+# Changing the index dimensions only applies to collections created afterwards.
+EMBEDDING_DIMENSIONS = int(os.environ.get('EMBEDDING_DIMENSIONS', EMBEDDING_MODEL_DIMENSIONS))
+VECTOR_INDEX_DIMENSIONS = int(os.environ.get('VECTOR_INDEX_DIMENSIONS', EMBEDDING_DIMENSIONS))
+RESCORE_PRECISION = os.environ.get('RESCORE_PRECISION', '').lower()
+RESCORE_OVERSAMPLING = int(os.environ.get('RESCORE_OVERSAMPLING', 4))
+
+# Embedding pipeline - chunks are embedded in batches with a cap on concurrent requests
+EMBEDDING_BATCH_SIZE = int(os.environ.get('EMBEDDING_BATCH_SIZE', 100))
+EMBEDDING_MAX_IN_FLIGHT = int(os.environ.get('EMBEDDING_MAX_IN_FLIGHT', 4))
+EMBEDDING_MAX_RETRIES = int(os.environ.get('EMBEDDING_MAX_RETRIES', 5))
+
+# Progress events are also kept in a capped Redis Stream per task so SSE clients can replay them
+PROGRESS_STREAM_MAXLEN = int(os.environ.get('PROGRESS_STREAM_MAXLEN', 500))
+PROGRESS_STREAM_TTL = int(os.environ.get('PROGRESS_STREAM_TTL', 60 * 60))
+
+# Parsed documents are shared between the chroma and summary tasks through Redis
+PARSED_DOCUMENT_TTL = int(os.environ.get('PARSED_DOCUMENT_TTL', 60 * 60))
+
+# Upload payloads are spooled once to a content-addressed blob store ("local" or "redis")
+BLOB_STORE_BACKEND = os.environ.get('BLOB_STORE_BACKEND', 'local')
+BLOB_STORE_DIR = os.environ.get('BLOB_STORE_DIR', os.path.join(tempfile.gettempdir(), 'document-rag-blobs'))
+BLOB_TTL = int(os.environ.get('BLOB_TTL', 60 * 60))
+
+# Streaming PDF ingestion - pages are parsed in a process pool and embedded as they arrive
+PDF_STREAMING = os.environ.get('PDF_STREAMING', 'true').lower() == 'true'
+PDF_PARSE_WORKERS = int(os.environ.get('PDF_PARSE_WORKERS', min(4, os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.environ.get('PDF_PAGES_PER_TASK', 4))
+PDF_PAGE_WINDOW = int(os.environ.get('PDF_PAGE_WINDOW', 32))
+
+# Upload pre-checks - obvious rejects are refused by the API before any task is queued.
+# Text beyond MAX_TEXT_UPLOAD_BYTES is far over the 100k token document limit (~4 bytes per token)
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 50 * 1024 * 1024))
+MAX_TEXT_UPLOAD_BYTES = int(os.environ.get('MAX_TEXT_UPLOAD_BYTES', 2 * 1024 * 1024))
+MAX_PDF_PAGES = int(os.environ.get('MAX_PDF_PAGES', 1000))
+
+# Map-reduce summaries - token-sized chunks summarized concurrently, reduced hierarchically
+SUMMARY_CHUNK_TOKENS = int(os.environ.get('SUMMARY_CHUNK_TOKENS', 8000))
+SUMMARY_CHUNK_OVERLAP = int(os.environ.get('SUMMARY_CHUNK_OVERLAP', 400))
+SUMMARY_REDUCE_TOKENS = int(os.environ.get('SUMMARY_REDUCE_TOKENS', 50000))
+SUMMARY_MAX_CONCURRENCY = int(os.environ.get('SUMMARY_MAX_CONCURRENCY', 8))
+
+# Summary/title cache keyed by document content, prompt version and model
+SUMMARY_CACHE_TTL = int(os.environ.get('SUMMARY_CACHE_TTL', 7 * 24 * 60 * 60))
+SUMMARY_CACHE_MAX_ENTRIES = int(os.environ.get('SUMMARY_CACHE_MAX_ENTRIES', 5000))
+
+# Chat queries run on a bounded thread pool so they never block the event loop
+CHAT_QUERY_WORKERS = int(os.environ.get('CHAT_QUERY_WORKERS', 16))
+
+# Batch chat requests - questions per request and LLM answers generated at once for one request
+CHAT_BATCH_MAX_QUESTIONS = int(os.environ.get('CHAT_BATCH_MAX_QUESTIONS', 20))
+CHAT_BATCH_MAX_CONCURRENCY = int(os.environ.get('CHAT_BATCH_MAX_CONCURRENCY', 8))
+
+# Warm per-user query handles (collection, vector store) kept by each API process
+QUERY_HANDLE_CACHE_SIZE = int(os.environ.get('QUERY_HANDLE_CACHE_SIZE', 256))
+QUERY_HANDLE_CACHE_TTL = int(os.environ.get('QUERY_HANDLE_CACHE_TTL', 30 * 60))
+
+# Semantic answer cache - reuse answers to near-identical questions on an unchanged collection
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', 0.95))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get('SEMANTIC_CACHE_MAX_ENTRIES', 50))
+SEMANTIC_CACHE_TTL = int(os.environ.get('SEMANTIC_CACHE_TTL', 24 * 60 * 60))
+
+# Retrieved chunks are merged into passages and packed into this many tokens of QA prompt context
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', 1500))
+
+# Fuse BM25 keyword matches with vector (MMR) results using reciprocal rank fusion
+HYBRID_RETRIEVAL = os.environ.get('HYBRID_RETRIEVAL', 'true').lower() == 'true'
+# Query terms found in more than this share of a user's chunks are left out of the BM25 search
+LEXICAL_MAX_TERM_SHARE = float(os.environ.get('LEXICAL_MAX_TERM_SHARE', 0.5))
+
+# Collection lifecycle - Chroma keeps every collection in RAM, so idle ones are evicted on a schedule.
+# Beyond the TTL, the least recently used collections go first while over the count or memory budget;
+# nothing accessed within the last COLLECTION_MIN_IDLE seconds is evicted for budget reasons.
+COLLECTION_TTL = int(os.environ.get('COLLECTION_TTL', 24 * 60 * 60))
+COLLECTION_MAX_COUNT = int(os.environ.get('COLLECTION_MAX_COUNT', 500))
+COLLECTION_MEMORY_BUDGET_MB = int(os.environ.get('COLLECTION_MEMORY_BUDGET_MB', 2048))
+COLLECTION_MIN_IDLE = int(os.environ.get('COLLECTION_MIN_IDLE', 10 * 60))
+COLLECTION_EVICTION_INTERVAL = int(os.environ.get('COLLECTION_EVICTION_INTERVAL', 5 * 60))
+
+# Celery queues - ingest (parse + vectors), summary (map-reduce LLM calls) and query each get their
+# own workers; hard time limits per queue, the soft limit fires a little earlier so errors are reported
+INGEST_TASK_TIME_LIMIT = int(os.environ.get('INGEST_TASK_TIME_LIMIT', 10 * 60))
+SUMMARY_TASK_TIME_LIMIT = int(os.environ.get('SUMMARY_TASK_TIME_LIMIT', 30 * 60))
+QUERY_TASK_TIME_LIMIT = int(os.environ.get('QUERY_TASK_TIME_LIMIT', 60))
+
+# Port of the Prometheus exporter started inside each Celery worker (the API serves /metrics)
+CELERY_METRICS_PORT = int(os.environ.get('CELERY_METRICS_PORT', 9100))
+
+# Disable to run load tests against a local server
+RATE_LIMITS_ENABLED = os.environ.get('RATE_LIMITS_ENABLED', 'true').lower() == 'true'
@@ -1,4 +1,4 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.documentUpload import router as document_router
 from app.api.textUpload import router as text_router
@@ -6,10 +6,12 @@ from app.api.chat import router as chat_router
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from slowapi.middleware import SlowAPIMiddleware
+from app.config import RATE_LIMITS_ENABLED
+from app.services.metrics import metrics_payload
 
 app = FastAPI()
 
-limiter = Limiter(key_func=get_remote_address)
+limiter = Limiter(key_func=get_remote_address, enabled=RATE_LIMITS_ENABLED)
 app.state.limiter = limiter
 app.add_middleware(SlowAPIMiddleware)
 
@@ -26,3 +28,7 @@ app.include_router(document_router, prefix="/document")
 app.include_router(text_router, prefix="/text")
 app.include_router(chat_router, prefix="/chat")
 
+@app.get("/metrics")
+async def metrics():
+    content, content_type = metrics_payload()
+    return Response(content=content, media_type=content_type)
@@ -0,0 +1,121 @@
+import os
+import mmap
+import time
+import uuid
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, Optional, Union
+from app.config import BLOB_STORE_BACKEND, BLOB_STORE_DIR, BLOB_TTL
+from app.clients import get_redis
+
+class BlobWriter:
+    """Spool an upload into the blob store chunk by chunk.
+
+    The content hash is computed while writing, so the payload never has to be
+    held in memory as a whole. `commit()` returns the blob reference.
+    """
+
+    def __init__(self):
+        self.hash = hashlib.sha256()
+        self.size = 0
+        if BLOB_STORE_BACKEND == 'local':
+            os.makedirs(BLOB_STORE_DIR, exist_ok=True)
+            self.file = tempfile.NamedTemporaryFile(dir=BLOB_STORE_DIR, suffix='.part', delete=False)
+        else:
+            self.temp_key = f"blob:upload:{uuid.uuid4()}"
+
+    def write(self, chunk: bytes):
+        self.hash.update(chunk)
+        self.size += len(chunk)
+        if BLOB_STORE_BACKEND == 'local':
+            self.file.write(chunk)
+        else:
+            pipe = get_redis().pipeline(transaction=False)
+            pipe.append(self.temp_key, chunk)
+            pipe.expire(self.temp_key, BLOB_TTL)
+            pipe.execute()
+
+    def commit(self) -> str:
+        ref = self.hash.hexdigest()
+        if BLOB_STORE_BACKEND == 'local':
+            self.file.close()
+            # An identical upload already exists: keep it and refresh its age
+            if os.path.exists(blob_path(ref)):
+                os.remove(self.file.name)
+                os.utime(blob_path(ref))
+            else:
+                os.replace(self.file.name, blob_path(ref))
+            purge_expired_blobs()
+        elif self.size == 0:
+            get_redis().set(f"blob:{ref}", b"", ex=BLOB_TTL)
+        else:
+            get_redis().rename(self.temp_key, f"blob:{ref}")
+            get_redis().expire(f"blob:{ref}", BLOB_TTL)
+        return ref
+
+    def discard(self):
+        if BLOB_STORE_BACKEND == 'local':
+            self.file.close()
+            if os.path.exists(self.file.name):
+                os.remove(self.file.name)
+        else:
+            get_redis().delete(self.temp_key)
+
+def put_blob(content: Union[bytes, str]) -> str:
+    """Store an in-memory payload and return its blob reference."""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    writer = BlobWriter()
+    try:
+        writer.write(content)
+        return writer.commit()
+    except Exception:
+        writer.discard()
+        raise
+
+def delete_blob(ref: str):
+    """Remove a blob no task is going to read, e.g. an upload rejected after it was stored."""
+    if BLOB_STORE_BACKEND == 'local':
+        try:
+            os.remove(blob_path(ref))
+        except FileNotFoundError:
+            pass
+    else:
+        get_redis().delete(f"blob:{ref}")
+
+def blob_path(ref: str) -> Optional[str]:
+    """Path of a blob on disk, only available with the local backend."""
+    if BLOB_STORE_BACKEND != 'local':
+        return None
+    return os.path.join(BLOB_STORE_DIR, ref)
+
+@contextmanager
+def open_blob(ref: str) -> Iterator[Union[mmap.mmap, bytes]]:
+    """Yield a read-only view of a blob: memory-mapped for local blobs, bytes for Redis blobs."""
+    if BLOB_STORE_BACKEND == 'local':
+        path = blob_path(ref)
+        if not os.path.exists(path):
+            raise ValueError("Uploaded document has expired, please upload it again")
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                yield b""
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                yield view
+    else:
+        content = get_redis().get(f"blob:{ref}")
+        if content is None:
+            raise ValueError("Uploaded document has expired, please upload it again")
+        yield content
+
+def purge_expired_blobs():
+    """Remove local blobs (and abandoned partial uploads) older than the blob TTL."""
+    cutoff = time.time() - BLOB_TTL
+    with os.scandir(BLOB_STORE_DIR) as entries:
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,103 @@
+import re
+import time
+from app.config import (
+    COLLECTION_TTL,
+    COLLECTION_MAX_COUNT,
+    COLLECTION_MEMORY_BUDGET_MB,
+    COLLECTION_MIN_IDLE,
+    VECTOR_INDEX_DIMENSIONS,
+)
+from app.clients import get_chroma_client, get_redis
+from app.services.collectionState import (
+    COLLECTION_ACCESS_KEY,
+    COLLECTION_VECTORS_KEY,
+    bump_collection_generation,
+    forget_collection,
+    record_collection_size,
+)
+from app.services.lexicalIndex import delete_lexical_index
+from app.services.compactVectors import delete_rescore_vectors
+
+def vector_bytes(dimensions: int) -> int:
+    """Chroma memory per vector: float32 values plus HNSW graph links and bookkeeping."""
+    return dimensions * 4 + 256
+
+BYTES_PER_VECTOR = vector_bytes(VECTOR_INDEX_DIMENSIONS)
+
+COLLECTION_NAME_PATTERN = re.compile(r"^user_(.+)_docs$")
+
+def estimate_collection_bytes(num_vectors: int) -> int:
+    return num_vectors * BYTES_PER_VECTOR
+
+def evict_collection(user_id: str):
+    """Drop the user's collection and everything derived from it."""
+    # Bump first so warm query handles in every process are refreshed and see the collection is gone.
+    # Semantic cache entries are keyed by generation, so the bump also makes them unreachable
+    # until they expire; no keyspace scan is needed.
+    bump_collection_generation(user_id)
+    try:
+        get_chroma_client().delete_collection(name=f"user_{user_id}_docs")
+    except Exception as e:
+        print(f"Collection for {user_id} was already gone: {e}")
+    delete_lexical_index(user_id)
+    delete_rescore_vectors(user_id)
+    forget_collection(user_id)
+
+def track_untracked_collections():
+    """Start the idle clock for collections created before they were tracked."""
+    tracked = {member.decode('utf-8') for member in get_redis().zrange(COLLECTION_ACCESS_KEY, 0, -1)}
+    for collection in get_chroma_client().list_collections():
+        name = getattr(collection, "name", collection)
+        match = COLLECTION_NAME_PATTERN.match(name)
+        if not match or match.group(1) in tracked:
+            continue
+        try:
+            num_vectors = get_chroma_client().get_collection(name=name).count()
+        except Exception:
+            continue
+        record_collection_size(match.group(1), num_vectors)
+
+def evict_idle_collections() -> list[str]:
+    """Evict collections idle for longer than the TTL, then the least recently used ones over budget."""
+    lock = get_redis().lock("collection_eviction:lock", timeout=10 * 60)
+    if not lock.acquire(blocking=False):
+        print("Collection eviction already running")
+        return []
+
+    try:
+        track_untracked_collections()
+        now = time.time()
+        # Oldest access first
+        entries = [
+            (member.decode('utf-8'), score)
+            for member, score in get_redis().zrange(COLLECTION_ACCESS_KEY, 0, -1, withscores=True)
+        ]
+        counts = get_redis().hmget(COLLECTION_VECTORS_KEY, [user_id for user_id, _ in entries]) if entries else []
+        sizes = {user_id: estimate_collection_bytes(int(count or 0)) for (user_id, _), count in zip(entries, counts)}
+
+        remaining = len(entries)
+        total_bytes = sum(sizes.values())
+        budget_bytes = COLLECTION_MEMORY_BUDGET_MB * 1024 * 1024
+        evicted = []
+        for user_id, last_access in entries:
+            idle = now - last_access
+            expired = idle > COLLECTION_TTL
+            over_budget = remaining > COLLECTION_MAX_COUNT or total_bytes > budget_bytes
+            if not expired and not (over_budget and idle > COLLECTION_MIN_IDLE):
+                # Entries are ordered by access time, so every later one is more recent
+                break
+            evict_collection(user_id)
+            evicted.append(user_id)
+            remaining -= 1
+            total_bytes -= sizes[user_id]
+
+        print(
+            f"Evicted {len(evicted)} collections, {remaining} left using about "
+            f"{total_bytes / (1024 * 1024):.0f}MB of {COLLECTION_MEMORY_BUDGET_MB}MB"
+        )
+        return evicted
+    finally:
+        try:
+            lock.release()
+        except Exception:
+            pass
@@ -0,0 +1,50 @@
+import time
+from app.clients import get_redis
+
+# user_id -> last ingest or query time, and user_id -> number of stored vectors
+COLLECTION_ACCESS_KEY = "collection_access"
+COLLECTION_VECTORS_KEY = "collection_vectors"
+
+# Queries refresh the access time at most this often per process
+TOUCH_INTERVAL = 60
+
+_last_touched: dict[str, float] = {}
+
+def collection_generation_key(user_id: str) -> str:
+    return f"collection_generation:{user_id}"
+
+def bump_collection_generation(user_id: str) -> int:
+    """Mark the user's collection as changed so per-process caches built on it are discarded."""
+    return get_redis().incr(collection_generation_key(user_id))
+
+def get_collection_generation(user_id: str) -> int:
+    """Current generation of the user's collection, 0 if it was never written."""
+    return int(get_redis().get(collection_generation_key(user_id)) or 0)
+
+def document_id_prefix(user_id: str, document_id: str) -> str:
+    """Common prefix of the ids of every chunk of one uploaded document."""
+    return f"{user_id}_{document_id}_"
+
+def touch_collection(user_id: str, force: bool = False):
+    """Record that the user's collection is in use so the lifecycle manager keeps it."""
+    now = time.time()
+    if not force and now - _last_touched.get(user_id, 0) < TOUCH_INTERVAL:
+        return
+    _last_touched[user_id] = now
+    get_redis().zadd(COLLECTION_ACCESS_KEY, {user_id: now})
+
+def record_collection_size(user_id: str, num_vectors: int):
+    """Store the vector count used for the lifecycle memory budget, and mark the collection as used."""
+    pipe = get_redis().pipeline()
+    pipe.hset(COLLECTION_VECTORS_KEY, user_id, num_vectors)
+    pipe.zadd(COLLECTION_ACCESS_KEY, {user_id: time.time()})
+    pipe.execute()
+    _last_touched[user_id] = time.time()
+
+def forget_collection(user_id: str):
+    """Stop tracking an evicted collection."""
+    pipe = get_redis().pipeline()
+    pipe.zrem(COLLECTION_ACCESS_KEY, user_id)
+    pipe.hdel(COLLECTION_VECTORS_KEY, user_id)
+    pipe.execute()
+    _last_touched.pop(user_id, None)
@@ -0,0 +1,69 @@
+import numpy as np
+from typing import Optional
+from app.config import EMBEDDING_MODEL_DIMENSIONS, EMBEDDING_DIMENSIONS, VECTOR_INDEX_DIMENSIONS, RESCORE_PRECISION
+from app.clients import get_redis
+
+# Quantized full embeddings are only needed when Chroma indexes a shorter prefix of them
+RESCORING = RESCORE_PRECISION in ("int8", "float16") and VECTOR_INDEX_DIMENSIONS < EMBEDDING_DIMENSIONS
+
+def collection_index_dimensions(collection) -> int:
+    """Vector size a collection was created with; older collections hold full-size embeddings."""
+    return (collection.metadata or {}).get("index_dimensions", EMBEDDING_MODEL_DIMENSIONS)
+
+def is_current_collection(collection) -> bool:
+    """False for collections created with other index dimensions, which can no longer be queried or extended."""
+    return collection_index_dimensions(collection) == VECTOR_INDEX_DIMENSIONS
+
+def truncate_embeddings(vectors, dimensions: int) -> np.ndarray:
+    """Keep the first `dimensions` of each (Matryoshka) embedding, renormalized to unit length."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    prefix = vectors[..., :dimensions]
+    return prefix / (np.linalg.norm(prefix, axis=-1, keepdims=True) + 1e-12)
+
+def index_embeddings(vectors: list[list[float]]) -> list[list[float]]:
+    """The part of each embedding that is stored in (and queried against) Chroma."""
+    if VECTOR_INDEX_DIMENSIONS >= len(vectors[0]):
+        return vectors
+    return truncate_embeddings(vectors, VECTOR_INDEX_DIMENSIONS).tolist()
+
+def quantize(vector, precision: str = RESCORE_PRECISION) -> bytes:
+    """float16, or int8 with a float32 scale per vector in front."""
+    vector = np.asarray(vector, dtype=np.float32)
+    if precision == "float16":
+        return vector.astype(np.float16).tobytes()
+    scale = np.float32(np.abs(vector).max() / 127 or 1.0)
+    return scale.tobytes() + np.round(vector / scale).astype(np.int8).tobytes()
+
+def dequantize(data: bytes, precision: str = RESCORE_PRECISION) -> np.ndarray:
+    if precision == "float16":
+        return np.frombuffer(data, dtype=np.float16).astype(np.float32)
+    scale = np.frombuffer(data[:4], dtype=np.float32)[0]
+    return np.frombuffer(data[4:], dtype=np.int8).astype(np.float32) * scale
+
+def rescore_vectors_key(user_id: str) -> str:
+    return f"rescore_vectors:{user_id}"
+
+def store_rescore_vectors(user_id: str, ids: list[str], vectors: list[list[float]]):
+    """Keep quantized full embeddings of newly stored chunks for rescoring."""
+    if RESCORING and ids:
+        get_redis().hset(rescore_vectors_key(user_id), mapping={
+            chunk_id: quantize(vector) for chunk_id, vector in zip(ids, vectors)
+        })
+
+def load_rescore_vectors(user_id: str, ids: list[str]) -> Optional[np.ndarray]:
+    """Full embeddings of the given chunks, or None unless every one of them has a rescoring copy."""
+    if not RESCORING or not ids:
+        return None
+    stored = get_redis().hmget(rescore_vectors_key(user_id), ids)
+    expected_size = len(quantize(np.zeros(EMBEDDING_DIMENSIONS, dtype=np.float32)))
+    if any(data is None or len(data) != expected_size for data in stored):
+        # Chunks stored before rescoring was enabled or with other settings
+        return None
+    return np.stack([dequantize(data) for data in stored])
+
+def delete_rescore_vectors(user_id: str, ids: Optional[list[str]] = None):
+    """Drop the rescoring copies of the given chunks, or of the whole collection."""
+    if ids is None:
+        get_redis().delete(rescore_vectors_key(user_id))
+    elif ids:
+        get_redis().hdel(rescore_vectors_key(user_id), *ids)
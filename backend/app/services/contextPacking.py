@@ -0,0 +1,80 @@
+from langchain_core.documents import Document
+from app.config import CONTEXT_TOKEN_BUDGET
+from app.services.tokenCount import count_tokens, get_encoding
+
+CONTEXT_SEPARATOR = "\n\n"
+
+# Chunks overlap by at most the splitter's 150 characters; shorter matches are coincidence
+MAX_OVERLAP_CHARS = 400
+MIN_OVERLAP_CHARS = 20
+
+def chunk_position(doc: Document) -> tuple[str, str, int]:
+    """(document, page, index) from a `{user}_{document}_{page}_{index}` chunk id."""
+    _, _, index = (doc.id or "").rpartition("_")
+    if not index.isdigit():
+        return "", "", -1
+    return doc.metadata.get("document_id", ""), str(doc.metadata.get("page", "")), int(index)
+
+def overlap_length(first: str, second: str) -> int:
+    """Length of the longest end of `first` that `second` starts with."""
+    for length in range(min(len(first), len(second), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:length]):
+            return length
+    return 0
+
+def merge_adjacent_chunks(documents: list[Document]) -> list[Document]:
+    """Join consecutive chunks of the same page into one passage, dropping the repeated overlap.
+
+    A merged passage takes the rank of its best ranked chunk.
+    """
+    positions = [chunk_position(doc) for doc in documents]
+    order = sorted(range(len(documents)), key=lambda i: positions[i])
+
+    runs = []
+    for i in order:
+        document_id, page, index = positions[i]
+        if runs and index >= 0:
+            previous_document, previous_page, previous_index = positions[runs[-1][-1]]
+            if previous_index >= 0 and (previous_document, previous_page, previous_index + 1) == (document_id, page, index):
+                runs[-1].append(i)
+                continue
+        runs.append([i])
+
+    merged = []
+    for run in runs:
+        text = documents[run[0]].page_content
+        for i in run[1:]:
+            following = documents[i].page_content
+            overlap = overlap_length(text, following)
+            text += following[overlap:] if overlap else " " + following
+        first = documents[run[0]]
+        merged.append((min(run), Document(id=first.id, page_content=text, metadata=first.metadata)))
+
+    return [doc for _, doc in sorted(merged, key=lambda item: item[0])]
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    encoding = get_encoding()
+    return encoding.decode(encoding.encode_ordinary(text)[:max_tokens])
+
+def pack_context(documents: list[Document], budget: int = CONTEXT_TOKEN_BUDGET) -> tuple[list[Document], int]:
+    """Best ranked passages that fit in `budget` tokens, and the tokens they use.
+
+    Passages that don't fit are skipped so shorter, lower ranked ones can still be used;
+    the top passage is cut to the budget rather than dropped.
+    """
+    separator_tokens = count_tokens(CONTEXT_SEPARATOR)
+    packed, used = [], 0
+    for doc in documents:
+        tokens = count_tokens(doc.page_content) + (separator_tokens if packed else 0)
+        if used + tokens <= budget:
+            packed.append(doc)
+            used += tokens
+        elif not packed:
+            text = truncate_to_tokens(doc.page_content, budget)
+            packed.append(Document(id=doc.id, page_content=text, metadata=doc.metadata))
+            used = count_tokens(text)
+    return packed, used
+
+def assemble_context(documents: list[Document], budget: int = CONTEXT_TOKEN_BUDGET) -> tuple[list[Document], int]:
+    """Retrieved chunks turned into the passages that go into the QA prompt."""
+    return pack_context(merge_adjacent_chunks(documents), budget)
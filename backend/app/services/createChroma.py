@@ -1,81 +1,40 @@
-import os
-import io
-import tempfile
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, UnstructuredMarkdownLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain.schema.document import Document
-import chromadb
-from app.config import embeddings, llm
-from typing import Union, List, Optional
-
-chroma_client = chromadb.HttpClient(host='localhost', port=8000)
-
-def create_chroma_db(file_type: str, user_id: str, content: Union[bytes, str]):
-    """Create a Chroma database from document content in memory."""
+import uuid
+from langchain_core.documents import Document
+from app.clients import get_chroma_client
+from app.config import VECTOR_INDEX_DIMENSIONS
+from app.services.embeddingPipeline import EmbeddingPipeline
+from app.services.parseDocument import MAX_DOCUMENT_TOKENS, reset_parsed_document, append_parsed_page, finish_parsed_document
+from app.services.collectionState import bump_collection_generation, touch_collection, record_collection_size
+from app.services.collectionState import document_id_prefix
+from app.services.lexicalIndex import update_lexical_index
+from app.services.compactVectors import delete_rescore_vectors, is_current_collection
+from app.services.collectionLifecycle import evict_collection
+from app.services.metrics import timed, chunks_total, tokens_total
+from app.services.tokenCount import TokenBudget
+from typing import Callable, Iterable, Iterator, Optional
+
+def create_chroma_db(
+    documents: list[Document],
+    user_id: str,
+    on_progress: Optional[Callable] = None,
+    document_id: Optional[str] = None,
+    content_hash: Optional[str] = None,
+):
+    """Split parsed documents into chunks and store them in the user's Chroma database."""
     try:
-        documents = load_document_from_memory(file_type, content)
         if not documents:
             raise ValueError("No documents found to process")
         
-        # Combine all pages' content
-        full_text = "\n\n".join(doc.page_content for doc in documents)
-        
-        # Check document size
-        num_tokens_total = llm.get_num_tokens(full_text)
-        if num_tokens_total > 100000:
-            raise ValueError("Document is too large to process")
-        
-        chunks = split_documents(documents, 500, 150)
-        add_to_chroma(chunks, user_id)
-
-        return full_text
+        with timed("split"):
+            chunks = split_documents(documents, 500, 150)
+        chunks_total.labels(outcome="split").inc(len(chunks))
+        return add_to_chroma(chunks, user_id, on_progress, document_id, content_hash)
     except Exception as e:
         raise Exception(f"Error in create_chroma_db: {str(e)}")
 
-def load_document_from_memory(file_type: str, content: Union[bytes, str]) -> list[Document]:
-    """Load documents from in-memory content."""
-    documents = []
-    
-    try:
-        if file_type == 'pdf':
-            # For PDFs: use a temporary file
-            if isinstance(content, str):
-                raise ValueError("PDF content must be provided as bytes")
-                
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-                temp_file.write(content)
-                temp_path = temp_file.name
-            
-            try:
-                loader = PyPDFLoader(file_path=temp_path)
-                documents = loader.load()
-            finally:
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-            
-        elif file_type in ['txt', 'text']:
-            # For text: create Document directly from the string content
-            if isinstance(content, bytes):
-                content = content.decode('utf-8')
-                
-            documents = [Document(page_content=content, metadata={"source": "text_upload"})]
-            
-        elif file_type in ['markdown', 'md']:
-            # For markdown: create Document directly with the markdown content
-            if isinstance(content, bytes):
-                content = content.decode('utf-8')
-                
-            documents = [Document(page_content=content, metadata={"source": "markdown_upload"})]
-            
-        else:
-            raise ValueError(f"Unsupported file type: {file_type}")
-            
-        return documents
-    except Exception as e:
-        raise Exception(f"Error loading documents: {str(e)}")
-
 def split_documents(documents: list[Document], chunk_size=500, chunk_overlap=150):
     """Split documents into smaller chunks with more overlap."""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
@@ -93,65 +52,252 @@ def clean_metadata(meta):
         if k != "_type"
     }
 
-def add_to_chroma(chunks: list[Document], user_id: str):
-    """Add document chunks to user's Chroma database using native ChromaDB API."""
+def get_user_collection(user_id: str):
+    """Get the user's collection, creating it on first use."""
     collection_name = f"user_{user_id}_docs"
-    
     try:
-        try:
-            collection = chroma_client.get_collection(name=collection_name)
-            print(f"Using existing collection: {collection_name}")
-        except Exception as e:
-            print(f"Creating new collection: {collection_name}")
-            collection = chroma_client.create_collection(
-                name=collection_name,
-                metadata={"hnsw:space": "cosine"}
-            )
-        
-        chunk_ids, chunk_texts, chunk_metadatas = [], [], []
-
-        for chunk in chunks:
-            source = chunk.metadata.get("source", "unknown")
-            page = chunk.metadata.get("page", "0")
-            chunk_id = f"{user_id}_{source.replace('/', '_')}_{page}_{len(chunk_texts)}"
-            chunk_text = chunk.page_content
-            metadata = clean_metadata(chunk.metadata)
-            chunk_ids.append(chunk_id)
-            chunk_texts.append(chunk_text)
-            chunk_metadatas.append(metadata)
-
-        if not chunk_texts:
-            print("No chunks to add to ChromaDB")
-            return 0
+        collection = get_chroma_client().get_collection(name=collection_name)
+        if not is_current_collection(collection):
+            print(f"Replacing collection {collection_name} built with other index dimensions")
+            evict_collection(user_id)
+            raise LookupError(collection_name)
+        print(f"Using existing collection: {collection_name}")
+    except Exception as e:
+        print(f"Creating new collection: {collection_name}")
+        collection = get_chroma_client().create_collection(
+            name=collection_name,
+            metadata={"hnsw:space": "cosine", "index_dimensions": VECTOR_INDEX_DIMENSIONS}
+        )
+        bump_collection_generation(user_id)
+    touch_collection(user_id, force=True)
+    return collection
 
-        try:
-            existing_ids = collection.get()["ids"]
-        except:
-            existing_ids = []
+def refresh_collection_size(collection, user_id: str):
+    """Record the collection's vector count for the lifecycle memory budget."""
+    try:
+        record_collection_size(user_id, collection.count())
+    except Exception as e:
+        print(f"Could not record collection size: {e}")
 
-        new_chunk_indices = [i for i, id in enumerate(chunk_ids) if id not in existing_ids]
+def queue_new_chunks(
+    collection,
+    pipeline: EmbeddingPipeline,
+    chunks: list[Document],
+    user_id: str,
+    document_id: str,
+    content_hash: Optional[str] = None,
+    start_index: int = 0,
+) -> tuple[list[str], list[str]]:
+    """Queue the chunks that are not yet in the collection on the embedding pipeline.
 
-        if not new_chunk_indices:
-            print("All chunks already exist in the collection")
-            return 0
+    Chunk ids are scoped to the uploaded document, so a retried task skips what it already
+    stored while a new upload never collides with an earlier one. `start_index` continues the
+    chunk numbering when a document is added in several parts.
+    Returns the ids and texts that were queued.
+    """
+    chunk_ids, chunk_texts, chunk_metadatas = [], [], []
 
-        new_ids = [chunk_ids[i] for i in new_chunk_indices]
-        new_texts = [chunk_texts[i] for i in new_chunk_indices]
-        new_metadatas = [chunk_metadatas[i] for i in new_chunk_indices]
+    for chunk in chunks:
+        page = chunk.metadata.get("page", "0")
+        chunk_id = f"{document_id_prefix(user_id, document_id)}{page}_{start_index + len(chunk_texts)}"
+        chunk_text = chunk.page_content
+        metadata = clean_metadata(chunk.metadata)
+        metadata["document_id"] = document_id
+        if content_hash:
+            metadata["content_hash"] = content_hash
+        chunk_ids.append(chunk_id)
+        chunk_texts.append(chunk_text)
+        chunk_metadatas.append(metadata)
 
-        # Using OpenAI embeddings directly here
-        new_embeddings = embeddings.embed_documents(new_texts)
+    if not chunk_texts:
+        return [], []
 
-        print(f"Adding {len(new_ids)} new chunks to ChromaDB")
-        collection.add(
-            documents=new_texts,
-            metadatas=new_metadatas,
-            ids=new_ids,
-            embeddings=new_embeddings
-        )
+    # Only look up the candidate ids instead of scanning the whole collection
+    try:
+        with timed("dedup_lookup"):
+            existing_ids = set(collection.get(ids=chunk_ids, include=[])["ids"])
+    except Exception:
+        existing_ids = set()
+    chunks_total.labels(outcome="duplicate").inc(len(existing_ids))
+
+    new_chunk_indices = [i for i, id in enumerate(chunk_ids) if id not in existing_ids]
+
+    new_ids = [chunk_ids[i] for i in new_chunk_indices]
+    new_texts = [chunk_texts[i] for i in new_chunk_indices]
+    new_metadatas = [chunk_metadatas[i] for i in new_chunk_indices]
+
+    # Batches are embedded concurrently (cache misses only) and stored as they complete
+    pipeline.add(new_ids, new_texts, new_metadatas)
+    return new_ids, new_texts
+
+def discard_chunks(collection, user_id: str, ids: list[str]):
+    """Remove the chunks a failed ingest already stored, with their rescoring copies."""
+    if not ids:
+        return
+    try:
+        collection.delete(ids=ids)
+        delete_rescore_vectors(user_id, ids)
+    except Exception as e:
+        print(f"Could not remove {len(ids)} partially stored chunks: {e}")
+
+def store_chunks(
+    collection,
+    user_id: str,
+    chunk_groups: Iterable[list[Document]],
+    on_progress: Optional[Callable] = None,
+    document_id: Optional[str] = None,
+    content_hash: Optional[str] = None,
+) -> tuple[list[str], list[str]]:
+    """Embed and store chunks as their groups arrive, keeping the lexical index in step.
+
+    Groups are numbered on from each other, so a document can be added in several parts.
+    Small groups (e.g. single pages) are collected until a full embedding batch is ready,
+    so the number of requests doesn't grow with the number of groups. If anything fails,
+    the chunks stored so far are removed again. Returns the ids and texts of the chunks
+    that were added.
+    """
+    new_ids, new_texts = [], []
+    waiting, chunk_index = [], 0
+    pipeline = EmbeddingPipeline(collection, on_progress, user_id=user_id)
+
+    def queue(chunks: list[Document]):
+        nonlocal chunk_index
+        ids, texts = queue_new_chunks(collection, pipeline, chunks, user_id, document_id, content_hash, chunk_index)
+        new_ids.extend(ids)
+        new_texts.extend(texts)
+        chunk_index += len(chunks)
+
+    try:
+        with pipeline:
+            for chunks in chunk_groups:
+                waiting += chunks
+                full = len(waiting) - len(waiting) % pipeline.batch_size
+                if full:
+                    queue(waiting[:full])
+                    waiting = waiting[full:]
+            if waiting:
+                queue(waiting)
+
+        # Keep the lexical index in step with the vectors
+        if new_ids:
+            with timed("lexical_index"):
+                update_lexical_index(user_id, new_ids, new_texts)
+    except Exception:
+        # Don't leave a partially indexed document behind
+        discard_chunks(collection, user_id, pipeline.stored_ids)
+        raise
+    finally:
+        # Invalidate query caches built on the previous contents
+        if pipeline.stored_ids:
+            bump_collection_generation(user_id)
+            refresh_collection_size(collection, user_id)
+    return new_ids, new_texts
+
+def add_to_chroma(
+    chunks: list[Document],
+    user_id: str,
+    on_progress: Optional[Callable] = None,
+    document_id: Optional[str] = None,
+    content_hash: Optional[str] = None,
+):
+    """Add document chunks to user's Chroma database using native ChromaDB API.
+
+    `on_progress(batches_done, batches_total, chunks_added)` is called after each batch is stored.
+    """
+    document_id = document_id or str(uuid.uuid4())
+    try:
+        with timed("chroma_collection"):
+            collection = get_user_collection(user_id)
+
+        if not chunks:
+            print("No chunks to add to ChromaDB")
+            return 0
+
+        with timed("add_to_chroma"):
+            new_ids, _ = store_chunks(collection, user_id, [chunks], on_progress, document_id, content_hash)
+        if not new_ids:
+            print("All chunks already exist in the collection")
+        else:
+            print(f"Added {len(new_ids)} new chunks to ChromaDB")
         
         return len(new_ids)
 
     except Exception as e:
         print(f"Error in add_to_chroma: {str(e)}")
         raise Exception(f"Failed to add documents to ChromaDB: {str(e)}")
+
+def create_chroma_db_streaming(
+    pages: Iterator[Document],
+    user_id: str,
+    parsed_key: str,
+    on_progress: Optional[Callable] = None,
+    on_parsed: Optional[Callable[[], None]] = None,
+    document_id: Optional[str] = None,
+    content_hash: Optional[str] = None,
+) -> dict:
+    """Split and embed pages as they are parsed instead of waiting for the whole document.
+
+    The first vectors are stored while later pages are still being parsed. Each page is
+    appended to the parsed document in Redis under `parsed_key` instead of being kept
+    here, so memory is bounded by the parser window and the embedding queue. Once the
+    last page has arrived, `on_parsed` is called while the remaining batches finish
+    embedding; it can start tasks that load the document with `load_parsed_document`.
+    """
+    document_id = document_id or str(uuid.uuid4())
+    collection = get_user_collection(user_id)
+    budget = TokenBudget(MAX_DOCUMENT_TOKENS)
+    num_pages = 0
+    # A retried task starts the parsed document over
+    reset_parsed_document(parsed_key)
+
+    def page_chunks() -> Iterator[list[Document]]:
+        nonlocal num_pages
+        for page in pages:
+            # Reject oversized documents as soon as the limit is crossed
+            with timed("token_count"):
+                page_tokens = budget.add(page.page_content)
+            tokens_total.labels(stage="parse").inc(page_tokens)
+
+            append_parsed_page(parsed_key, page)
+            num_pages += 1
+            with timed("split"):
+                chunks = split_documents([page], 500, 150)
+            chunks_total.labels(outcome="split").inc(len(chunks))
+            yield chunks
+
+        if not num_pages:
+            raise ValueError("No documents found to process")
+
+        finish_parsed_document(parsed_key, budget.total)
+        print(f"Parsed document: {num_pages} pages, {budget.total} tokens")
+        if on_parsed:
+            on_parsed()
+
+    try:
+        new_ids, _ = store_chunks(collection, user_id, page_chunks(), on_progress, document_id, content_hash)
+    except Exception as e:
+        raise Exception(f"Error in create_chroma_db: {str(e)}")
+
+    print(f"Added {len(new_ids)} new chunks to ChromaDB")
+    return {"num_pages": num_pages, "num_tokens": budget.total}
+
+def delete_document(user_id: str, document_id: str) -> int:
+    """Remove every chunk of one uploaded document from the user's collection and lexical index."""
+    try:
+        collection = get_chroma_client().get_collection(name=f"user_{user_id}_docs")
+    except Exception:
+        return 0
+
+    ids = collection.get(where={"document_id": document_id}, include=[])["ids"]
+    if not ids:
+        return 0
+
+    try:
+        collection.delete(ids=ids)
+        update_lexical_index(user_id, remove_ids=ids)
+        delete_rescore_vectors(user_id, ids)
+    finally:
+        bump_collection_generation(user_id)
+        refresh_collection_size(collection, user_id)
+    print(f"Deleted {len(ids)} chunks of document {document_id}")
+    return len(ids)
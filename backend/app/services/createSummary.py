@@ -1,10 +1,48 @@
 import os
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain.schema.document import Document
-from langchain.chains.summarize import load_summarize_chain
-from langchain.prompts import PromptTemplate
-from typing import Union, List
-from app.config import llm
+import json
+import hashlib
+import redis
+from langchain_core.prompts import PromptTemplate
+from app.clients import get_llm
+from app.config import LLM_MODEL, SUMMARY_CHUNK_TOKENS, SUMMARY_CHUNK_OVERLAP, SUMMARY_REDUCE_TOKENS, SUMMARY_MAX_CONCURRENCY
+from app.config import SUMMARY_CACHE_MAX_ENTRIES, SUMMARY_CACHE_TTL
+from app.services.redisCache import RedisLRUCache
+from app.services.metrics import timed, tokens_total
+from app.services.tokenCount import count_tokens
+from typing import Optional
+
+# Bump whenever the summary or title prompts change so cached results are not reused
+SUMMARY_PROMPT_VERSION = "1"
+SUMMARY_ERROR_PREFIX = "Error creating summary"
+
+summary_cache = RedisLRUCache(
+    namespace="summary_cache",
+    max_entries=SUMMARY_CACHE_MAX_ENTRIES,
+    ttl=SUMMARY_CACHE_TTL,
+)
+
+def summary_cache_key(full_text: str) -> str:
+    """Hash of the whitespace-normalized text, prompt version and model."""
+    normalized = " ".join(full_text.split())
+    return hashlib.sha256(f"{LLM_MODEL}\n{SUMMARY_PROMPT_VERSION}\n{normalized}".encode('utf-8')).hexdigest()
+
+def get_cached_summary(full_text: str) -> Optional[dict]:
+    """Return the cached {"summary", "title"} for this text, if any."""
+    try:
+        cached = summary_cache.get(summary_cache_key(full_text))
+    except redis.RedisError as e:
+        print(f"Summary cache unavailable: {str(e)}")
+        return None
+    return json.loads(cached) if cached is not None else None
+
+def cache_summary(full_text: str, summary: str, title: str):
+    """Store a summary and title, unless the summary is an error message."""
+    if summary.startswith(SUMMARY_ERROR_PREFIX):
+        return
+    try:
+        summary_cache.set(summary_cache_key(full_text), json.dumps({"summary": summary, "title": title}))
+    except redis.RedisError as e:
+        print(f"Failed to cache summary: {str(e)}")
 
 def create_title(summary: str):
     prompt = f"""
@@ -17,39 +55,80 @@ def create_title(summary: str):
     text:
     {summary}
     """
-    title = llm.invoke(prompt)
+    with timed("title"):
+        title = get_llm().invoke(prompt)
     return title.content
 
-def create_documents(documents: list[Document], chunk_size=10000, chunk_overlap=500):
-    """Split documents into chunks for summarization."""
+map_prompt = """
+        Give a fundemntal overview of the following text:
+        "{text}":
+        """
+map_prompt_template = PromptTemplate(template=map_prompt, input_variables=["text"])
+
+combine_prompt = """
+        Write a comprehensive and detailed summary of the following text delimited by triple backquotes.
+        The summary should be comprehensive and separated into sections/subsections (compartments). It should be in markdown format.
+        Main compartments should have a #heading. Subcompartments should have a ##heading. Do not include ###heading. Only # and ## for headings, - for lists, and ** for bold text. 
+        Do not say that this is a summary. Do not include a title. Only the compartments. Example output structure:
+
+        # Abstract 
+        This document presents a detailed examination of a meta-analysis article published in the Iranian Journal of Public Health, which investigates the efficacy and side effects of two antiepileptic drugs: levetiracetam (LEV) and carbamazepine (CBZ). 
+        The study aims to provide insights into the treatment of epilepsy, a condition affecting millions worldwide.
+        
+        # Background on Epilepsy
+        - **Prevalence**: Epilepsy is a common neurological disorder, with an estimated 70 million individuals affected globally. The incidence varies significantly between high-income and low- to middle-income countries.
+        - **Treatment Gap**: Approximately 85% of patients with epilepsy do not receive adequate treatment, despite many having forms of the condition that are manageable with medication.
+
+        # Drugs Compared
+        ## Levetiracetam
+        A widely used antiepileptic drug known for its effectiveness in controlling seizures.
+        ## Carbamazepine
+        Another commonly prescribed antiepileptic medication with a similar mechanism of action.
+
+        Here is the text to compartmentalize.:
+        ```{text}```
+        
+        COMPARTMENTS:
+        """
+combine_prompt_template = PromptTemplate(template=combine_prompt, input_variables=["text"])
+
+def split_text_by_tokens(text: str, chunk_tokens: int, overlap_tokens: int) -> list[str]:
+    """Split text into chunks measured in model tokens rather than characters."""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
     text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size, 
-        chunk_overlap=chunk_overlap
+        chunk_size=chunk_tokens,
+        chunk_overlap=overlap_tokens,
+        length_function=count_tokens,
     )
-    return text_splitter.split_documents(documents)
+    return text_splitter.split_text(text)
+
+def group_by_token_budget(texts: list[str], budget: int) -> list[list[str]]:
+    """Group consecutive texts so each group stays within the token budget."""
+    groups, current, current_tokens = [], [], 0
+    for text in texts:
+        tokens = count_tokens(text)
+        if current and current_tokens + tokens > budget:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+def run_prompts(template: PromptTemplate, texts: list[str]) -> list[str]:
+    """Run one LLM call per text with bounded parallelism, keeping the input order."""
+    prompts = [template.format(text=text) for text in texts]
+    results = get_llm().batch(prompts, config={"max_concurrency": SUMMARY_MAX_CONCURRENCY})
+    return [result.content for result in results]
 
-def create_document_summary(file_type: str, content: Union[bytes, str]):
-    """Create a summarized version of the document from in-memory content."""
-    print(f"Creating document summary for {file_type}")
+def create_document_summary(full_text: str, num_tokens_total: int):
+    """Create a summarized version of an already parsed document."""
+    print(f"Creating document summary for {num_tokens_total} tokens")
+    tokens_total.labels(stage="summary").inc(num_tokens_total)
     try:
-        # Import here to avoid circular imports
-        from app.services.createChroma import load_document_from_memory
-        
-        # Use the common document loading function for all file types
-        documents = load_document_from_memory(file_type, content)
-        print(f"Loaded document")
-        
-        if not documents:
+        if not full_text:
             return "No documents found to summarize."
-        
-        # Combine all pages' content
-        full_text = "\n\n".join(doc.page_content for doc in documents)
-        num_tokens_total = llm.get_num_tokens(full_text)
-        print(f"Total document size: {num_tokens_total} tokens")
-        
-        # Check document size - use the same limit as createChroma.py
-        if num_tokens_total > 100000:
-            raise ValueError("Document is too large to process")
             
         if num_tokens_total < 15000:
             prompt = f"""
@@ -75,74 +154,32 @@ def create_document_summary(file_type: str, content: Union[bytes, str]):
             Here is the text to compartmentalize.:
             ```{full_text}```
             """
-            summary = llm.invoke(prompt)
+            with timed("summary_single"):
+                summary = get_llm().invoke(prompt)
             return summary.content
 
-        chunk_size = num_tokens_total // 1 # creates 4 chunks for the summary
-        chunk_overlap = chunk_size // 10
-        print(f"Using chunk size: {chunk_size}, chunk overlap: {chunk_overlap}")
-        
-        # Create a single document with all content for chunking
-        full_document = Document(page_content=full_text, metadata={"source": "full_document"})
-        docs = create_documents([full_document], chunk_size, chunk_overlap)
-        print(f"Split into {len(docs)} chunks")
-        
-        # Get token count of first document
-        if docs:
-            first_doc_tokens = llm.get_num_tokens(docs[0].page_content)
-            print(f"First chunk token count: ~{first_doc_tokens}")
-        
-        # Create prompts
-        map_prompt = """
-        Give a fundemntal overview of the following text:
-        "{text}":
-        """
-        map_prompt_template = PromptTemplate(template=map_prompt, input_variables=["text"])
-    
-        combine_prompt = """
-        Write a comprehensive and detailed summary of the following text delimited by triple backquotes.
-        The summary should be comprehensive and separated into sections/subsections (compartments). It should be in markdown format.
-        Main compartments should have a #heading. Subcompartments should have a ##heading. Do not include ###heading. Only # and ## for headings, - for lists, and ** for bold text. 
-        Do not say that this is a summary. Do not include a title. Only the compartments. Example output structure:
+        with timed("summary_split"):
+            chunks = split_text_by_tokens(full_text, SUMMARY_CHUNK_TOKENS, SUMMARY_CHUNK_OVERLAP)
+        print(f"Split into {len(chunks)} chunks of up to {SUMMARY_CHUNK_TOKENS} tokens")
 
-        # Abstract 
-        This document presents a detailed examination of a meta-analysis article published in the Iranian Journal of Public Health, which investigates the efficacy and side effects of two antiepileptic drugs: levetiracetam (LEV) and carbamazepine (CBZ). 
-        The study aims to provide insights into the treatment of epilepsy, a condition affecting millions worldwide.
-        
-        # Background on Epilepsy
-        - **Prevalence**: Epilepsy is a common neurological disorder, with an estimated 70 million individuals affected globally. The incidence varies significantly between high-income and low- to middle-income countries.
-        - **Treatment Gap**: Approximately 85% of patients with epilepsy do not receive adequate treatment, despite many having forms of the condition that are manageable with medication.
+        # Map: overview of every chunk, run concurrently
+        with timed("summary_map"):
+            summaries = run_prompts(map_prompt_template, chunks)
 
-        # Drugs Compared
-        ## Levetiracetam
-        A widely used antiepileptic drug known for its effectiveness in controlling seizures.
-        ## Carbamazepine
-        Another commonly prescribed antiepileptic medication with a similar mechanism of action.
+        # Reduce: collapse groups of overviews until they fit in one combine call
+        while len(summaries) > 1 and count_tokens("\n\n".join(summaries)) > SUMMARY_REDUCE_TOKENS:
+            groups = group_by_token_budget(summaries, SUMMARY_REDUCE_TOKENS)
+            print(f"Collapsing {len(summaries)} intermediate summaries into {len(groups)}")
+            if len(groups) == len(summaries):
+                # Every summary is over budget on its own, nothing left to merge
+                break
+            with timed("summary_reduce"):
+                summaries = run_prompts(map_prompt_template, ["\n\n".join(group) for group in groups])
 
-        Here is the text to compartmentalize.:
-        ```{text}```
-        
-        COMPARTMENTS:
-        """
-        combine_prompt_template = PromptTemplate(template=combine_prompt, input_variables=["text"])
-    
-        # Create and run summary chain
-        summary_chain = load_summarize_chain(
-            llm=llm, 
-            chain_type='map_reduce',
-            verbose=False,
-            map_prompt=map_prompt_template,
-            combine_prompt=combine_prompt_template,
-        )
-    
-        # Use invoke instead of run (which is deprecated)
-        output = summary_chain.invoke(docs)
-        
-        # Check if the output is a dictionary (newer versions of langchain)
-        if isinstance(output, dict):
-            return output.get("output_text", str(output))
-        return output
+        with timed("summary_combine"):
+            summary = get_llm().invoke(combine_prompt_template.format(text="\n\n".join(summaries)))
+        return summary.content
         
     except Exception as e:
         print(f"Error creating document summary: {e}")
-        return f"Error creating summary: {str(e)}"
+        return f"{SUMMARY_ERROR_PREFIX}: {str(e)}"
@@ -0,0 +1,71 @@
+import hashlib
+import numpy as np
+import redis
+from app.clients import get_embeddings
+from app.config import (
+    EMBEDDING_MODEL,
+    EMBEDDING_MODEL_DIMENSIONS,
+    EMBEDDING_DIMENSIONS,
+    EMBEDDING_CACHE_MAX_MB,
+    EMBEDDING_CACHE_TTL,
+)
+from app.services.redisCache import RedisLRUCache
+from app.services.metrics import timed, chunks_total
+
+# Redis memory per cached embedding besides the float32 vector: its key and its index entry
+ENTRY_OVERHEAD_BYTES = 300
+
+def embedding_cache_entries(max_mb: int = EMBEDDING_CACHE_MAX_MB, dimensions: int = EMBEDDING_DIMENSIONS) -> int:
+    """Number of embeddings that fit in `max_mb` of Redis memory."""
+    return max(1, max_mb * 1024 * 1024 // (dimensions * 4 + ENTRY_OVERHEAD_BYTES))
+
+embedding_cache = RedisLRUCache(
+    namespace="embedding_cache",
+    max_entries=embedding_cache_entries(),
+    ttl=EMBEDDING_CACHE_TTL,
+)
+
+def embedding_cache_key(text: str, model: str = EMBEDDING_MODEL, dimensions: int = EMBEDDING_DIMENSIONS) -> str:
+    """Content address of a chunk: hash of the model name, embedding size and the chunk text."""
+    if dimensions != EMBEDDING_MODEL_DIMENSIONS:
+        # Full-size embeddings keep their original keys
+        model = f"{model}/{dimensions}"
+    return hashlib.sha256(f"{model}\n{text}".encode('utf-8')).hexdigest()
+
+def embed_documents_cached(texts: list[str]) -> list[list[float]]:
+    """Embed texts, only sending cache misses to the embedding API."""
+    keys = [embedding_cache_key(text) for text in texts]
+
+    try:
+        cached = embedding_cache.get_many(keys)
+    except redis.RedisError as e:
+        print(f"Embedding cache unavailable: {str(e)}")
+        cached = [None] * len(texts)
+
+    vectors = [np.frombuffer(v, dtype=np.float32).tolist() if v is not None else None for v in cached]
+
+    # Identical chunks within one document only need to be embedded once
+    missing = {}
+    for i, vector in enumerate(vectors):
+        if vector is None:
+            missing.setdefault(keys[i], texts[i])
+
+    if missing:
+        with timed("embedding_api"):
+            new_vectors = dict(zip(missing.keys(), get_embeddings().embed_documents(list(missing.values()))))
+        chunks_total.labels(outcome="embedded").inc(len(missing))
+        try:
+            embedding_cache.set_many({
+                key: np.asarray(vector, dtype=np.float32).tobytes()
+                for key, vector in new_vectors.items()
+            })
+        except redis.RedisError as e:
+            print(f"Failed to populate embedding cache: {str(e)}")
+
+        vectors = [v if v is not None else new_vectors[keys[i]] for i, v in enumerate(vectors)]
+
+    return vectors
+
+def embed_query_cached(text: str) -> list[float]:
+    """Embed a single question through the same cache as document chunks."""
+    return embed_documents_cached([text])[0]
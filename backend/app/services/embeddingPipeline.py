@@ -0,0 +1,102 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, ALL_COMPLETED, wait
+from typing import Callable, Optional
+from app.config import EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_IN_FLIGHT, EMBEDDING_MAX_RETRIES
+from app.services.embeddingCache import embed_documents_cached
+from app.services.compactVectors import index_embeddings, store_rescore_vectors
+from app.services.metrics import timed, chunks_total
+
+def embed_with_backoff(texts: list[str], max_retries: int = EMBEDDING_MAX_RETRIES) -> list[list[float]]:
+    """Embed a batch, backing off exponentially (with jitter) when rate limited."""
+    from openai import RateLimitError
+    delay = 1.0
+    for attempt in range(max_retries + 1):
+        try:
+            with timed("embed_batch"):
+                return embed_documents_cached(texts)
+        except RateLimitError:
+            if attempt == max_retries:
+                raise
+            sleep_for = delay * (1 + random.random())
+            print(f"Embedding rate limited, retrying in {sleep_for:.1f}s")
+            time.sleep(sleep_for)
+            delay = min(delay * 2, 30.0)
+
+class EmbeddingPipeline:
+    """Embed chunks in batches on a bounded pool and write each batch to Chroma as it completes.
+
+    Embedding requests run concurrently (at most `max_in_flight` at a time) while
+    Chroma writes happen on the calling thread, one batch at a time.
+    """
+
+    def __init__(
+        self,
+        collection,
+        on_progress: Optional[Callable[[int, int, int], None]] = None,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        max_in_flight: int = EMBEDDING_MAX_IN_FLIGHT,
+        user_id: Optional[str] = None,
+    ):
+        self.collection = collection
+        self.user_id = user_id
+        self.on_progress = on_progress
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self.pending = {}
+        self.batches_total = 0
+        self.batches_done = 0
+        self.added = 0
+        # Ids written to Chroma so far, so a failed ingest can remove what it stored
+        self.stored_ids = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def add(self, ids: list[str], texts: list[str], metadatas: list[dict]):
+        """Queue chunks for embedding, blocking while the in-flight limit is reached."""
+        for start in range(0, len(ids), self.batch_size):
+            end = start + self.batch_size
+            while len(self.pending) >= self.max_in_flight:
+                self._drain(FIRST_COMPLETED)
+
+            future = self.executor.submit(embed_with_backoff, texts[start:end])
+            self.pending[future] = (ids[start:end], texts[start:end], metadatas[start:end])
+            self.batches_total += 1
+
+    def _drain(self, return_when):
+        done, _ = wait(self.pending, return_when=return_when)
+        for future in done:
+            batch_ids, batch_texts, batch_metadatas = self.pending.pop(future)
+            embeddings = future.result()
+            if self.user_id:
+                # Before the vectors, so queries never find a chunk without its rescoring copy
+                store_rescore_vectors(self.user_id, batch_ids, embeddings)
+            with timed("chroma_write"):
+                self.collection.add(
+                    documents=batch_texts,
+                    metadatas=batch_metadatas,
+                    ids=batch_ids,
+                    embeddings=index_embeddings(embeddings)
+                )
+            chunks_total.labels(outcome="stored").inc(len(batch_ids))
+            self.stored_ids += batch_ids
+            self.added += len(batch_ids)
+            self.batches_done += 1
+            if self.on_progress:
+                self.on_progress(self.batches_done, self.batches_total, self.added)
+
+    def close(self) -> int:
+        """Wait for every queued batch to be stored and return the number of chunks added."""
+        try:
+            self._drain(ALL_COMPLETED)
+        finally:
+            self.executor.shutdown(cancel_futures=True)
+        return self.added
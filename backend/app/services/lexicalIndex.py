@@ -0,0 +1,184 @@
+import re
+import json
+import math
+import heapq
+from collections import Counter
+from typing import Optional
+from app.clients import get_redis
+from app.config import LEXICAL_MAX_TERM_SHARE
+
+# Keeps codes such as "4.2.1", "covid-19" or "x_ray" together as one term
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._\-][a-z0-9]+)*")
+
+# Words in nearly every chunk of any document; they are neither indexed nor searched
+STOPWORDS = frozenset("""
+a about after all also an and any are as at be been but by can could did do does for from
+had has have how i if in into is it its may more most no not of on or other should so such
+than that the their them then there these they this those to was were what when where which
+who why will with would you your
+""".split())
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+def lexical_index_key(user_id: str) -> str:
+    return f"bm25_index:{user_id}"
+
+def doc_lengths_key(user_id: str) -> str:
+    return f"{lexical_index_key(user_id)}:doc_lengths"
+
+def doc_terms_key(user_id: str) -> str:
+    return f"{lexical_index_key(user_id)}:doc_terms"
+
+def postings_key(user_id: str, term: str) -> str:
+    return f"{lexical_index_key(user_id)}:term:{term}"
+
+def stats_key(user_id: str) -> str:
+    return f"{lexical_index_key(user_id)}:stats"
+
+class BM25Index:
+    """BM25 inverted index over a user's chunk ids, stored in Redis.
+
+    Each term has a hash of chunk id -> term frequency, next to hashes of chunk lengths
+    and of the terms in each chunk, so adding or removing chunks only touches the terms
+    of those chunks. A search reads the postings of the query terms and the lengths of
+    the chunks in them, skipping stopwords and terms found in more than
+    LEXICAL_MAX_TERM_SHARE of the chunks.
+    """
+
+    def __init__(self, user_id: str, k1: float = 1.5, b: float = 0.75):
+        self.user_id = user_id
+        self.k1 = k1
+        self.b = b
+
+    def __len__(self):
+        return get_redis().hlen(doc_lengths_key(self.user_id))
+
+    def search(self, query: str, k: int = 10, id_prefix: str = "") -> list[tuple[str, float]]:
+        """Top `k` (chunk id, score) pairs for the query, optionally only among ids starting with `id_prefix`."""
+        terms = [term for term in set(tokenize(query)) if term not in STOPWORDS]
+        if not terms:
+            return []
+
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.hlen(doc_lengths_key(self.user_id))
+        pipe.hget(stats_key(self.user_id), "total_length")
+        for term in terms:
+            pipe.hlen(postings_key(self.user_id, term))
+        num_docs, total_length, *document_frequencies = pipe.execute()
+        if not num_docs:
+            return []
+
+        # Terms found in most chunks barely change the ranking but have the largest postings
+        max_frequency = max(1, LEXICAL_MAX_TERM_SHARE * num_docs)
+        terms = [
+            (term, frequency) for term, frequency in zip(terms, document_frequencies)
+            if 0 < frequency <= max_frequency
+        ]
+        if not terms:
+            return []
+
+        pipe = get_redis().pipeline(transaction=False)
+        for term, _ in terms:
+            pipe.hgetall(postings_key(self.user_id, term))
+
+        # (document frequency, {chunk id: term frequency}) per query term; the frequency
+        # counts chunks outside `id_prefix` too, as in the collection-wide statistics
+        matches = []
+        for (_, document_frequency), posting in zip(terms, pipe.execute()):
+            frequencies = {doc_id.decode('utf-8'): int(tf) for doc_id, tf in posting.items()}
+            if id_prefix:
+                frequencies = {doc_id: tf for doc_id, tf in frequencies.items() if doc_id.startswith(id_prefix)}
+            matches.append((document_frequency, frequencies))
+
+        doc_ids = list({doc_id for _, frequencies in matches for doc_id in frequencies})
+        if not doc_ids:
+            return []
+        doc_lengths = dict(zip(doc_ids, get_redis().hmget(doc_lengths_key(self.user_id), doc_ids)))
+
+        avg_length = int(total_length or 0) / num_docs or 1.0
+        scores: dict[str, float] = {}
+        for document_frequency, frequencies in matches:
+            idf = math.log(1 + (num_docs - document_frequency + 0.5) / (document_frequency + 0.5))
+            for doc_id, tf in frequencies.items():
+                if doc_lengths[doc_id] is None:
+                    # Removed while this search was running
+                    continue
+                norm = tf + self.k1 * (1 - self.b + self.b * int(doc_lengths[doc_id]) / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+def _index_lock(user_id: str):
+    return get_redis().lock(f"{lexical_index_key(user_id)}:lock", timeout=60, blocking_timeout=60)
+
+def _add_chunk(pipe, user_id: str, doc_id: str, text: str) -> int:
+    """Queue the writes that add one chunk; returns the chunk's length."""
+    terms = tokenize(text)
+    # Stopwords still count towards the length but get no postings
+    counts = Counter(term for term in terms if term not in STOPWORDS)
+    pipe.hset(doc_lengths_key(user_id), doc_id, len(terms))
+    pipe.hset(doc_terms_key(user_id), doc_id, json.dumps(list(counts)))
+    for term, count in counts.items():
+        pipe.hset(postings_key(user_id, term), doc_id, count)
+    return len(terms)
+
+def load_lexical_index(user_id: str) -> Optional[BM25Index]:
+    """The user's index, or None if nothing was indexed."""
+    index = BM25Index(user_id)
+    return index if len(index) else None
+
+def update_lexical_index(user_id: str, add_ids: list[str] = (), add_texts: list[str] = (), remove_ids: list[str] = ()):
+    """Add and remove chunks from the user's index, touching only the terms of those chunks."""
+    add_ids, add_texts, remove_ids = list(add_ids), list(add_texts), list(remove_ids)
+    with _index_lock(user_id):
+        pipe = get_redis().pipeline()
+        total_change = 0
+
+        removed = []
+        if remove_ids:
+            lengths = get_redis().hmget(doc_lengths_key(user_id), remove_ids)
+            terms = get_redis().hmget(doc_terms_key(user_id), remove_ids)
+            for doc_id, length, doc_terms in zip(remove_ids, lengths, terms):
+                if length is None:
+                    continue
+                removed.append(doc_id)
+                total_change -= int(length)
+                for term in json.loads(doc_terms):
+                    pipe.hdel(postings_key(user_id, term), doc_id)
+            if removed:
+                pipe.hdel(doc_lengths_key(user_id), *removed)
+                pipe.hdel(doc_terms_key(user_id), *removed)
+
+        if add_ids:
+            # Chunks already in the index are kept as they are, unless they were just removed
+            existing = get_redis().hmget(doc_lengths_key(user_id), add_ids)
+            skip = {doc_id for doc_id, length in zip(add_ids, existing) if length is not None} - set(removed)
+            for doc_id, text in zip(add_ids, add_texts):
+                if doc_id in skip:
+                    continue
+                skip.add(doc_id)
+                total_change += _add_chunk(pipe, user_id, doc_id, text)
+
+        if total_change:
+            pipe.hincrby(stats_key(user_id), "total_length", total_change)
+        pipe.execute()
+
+def delete_lexical_index(user_id: str):
+    """Drop the user's index: every term's postings and the per-chunk hashes."""
+    with _index_lock(user_id):
+        terms = set()
+        for doc_terms in get_redis().hvals(doc_terms_key(user_id)):
+            terms.update(json.loads(doc_terms))
+        keys = [postings_key(user_id, term) for term in terms]
+        keys += [doc_lengths_key(user_id), doc_terms_key(user_id), stats_key(user_id)]
+        for start in range(0, len(keys), 1000):
+            get_redis().delete(*keys[start:start + 1000])
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[str]:
+    """Fuse several rankings of ids, best first."""
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
@@ -0,0 +1,61 @@
+import os
+import time
+from contextlib import contextmanager
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client import multiprocess
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+stage_duration = Histogram(
+    "rag_stage_duration_seconds",
+    "Duration of each ingest, summary and query stage",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+chunks_total = Counter(
+    "rag_chunks_total",
+    "Document chunks by outcome (split, embedded, stored, duplicate)",
+    ["outcome"],
+)
+tokens_total = Counter(
+    "rag_tokens_total",
+    "Tokens counted per stage",
+    ["stage"],
+)
+cache_requests_total = Counter(
+    "rag_cache_requests_total",
+    "Cache lookups by cache and result (hit, miss)",
+    ["cache", "result"],
+)
+
+@contextmanager
+def timed(stage: str):
+    """Time a stage into the stage histogram."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_duration.labels(stage=stage).observe(time.perf_counter() - start)
+
+def record_cache(cache: str, hits: int = 0, misses: int = 0):
+    if hits:
+        cache_requests_total.labels(cache=cache, result="hit").inc(hits)
+    if misses:
+        cache_requests_total.labels(cache=cache, result="miss").inc(misses)
+
+def metrics_registry():
+    """Registry to export: every process's metrics when PROMETHEUS_MULTIPROC_DIR is set, else this process's."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+def mark_process_dead(pid: int):
+    """Drop an exited process's live gauges from the shared multiprocess files."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
+
+def metrics_payload() -> tuple[bytes, str]:
+    """Exposition for this process, or for all processes when PROMETHEUS_MULTIPROC_DIR is set."""
+    return generate_latest(metrics_registry()), CONTENT_TYPE_LATEST
@@ -0,0 +1,115 @@
+import numpy as np
+from typing import Callable, Optional
+from langchain_core.documents import Document
+from app.config import RESCORE_OVERSAMPLING
+from app.services.compactVectors import index_embeddings
+
+def mmr_select(query_embedding, candidate_embeddings, k: int = 3, lambda_mult: float = 0.7) -> list[int]:
+    """Maximal marginal relevance over a candidate set, returning the selected indices in order.
+
+    The query relevance vector and the candidate similarity matrix are computed once;
+    each selection step is then a single vectorized update.
+    """
+    candidates = np.asarray(candidate_embeddings, dtype=np.float32)
+    if candidates.size == 0 or k <= 0:
+        return []
+
+    query = np.asarray(query_embedding, dtype=np.float32)
+    candidates = candidates / (np.linalg.norm(candidates, axis=1, keepdims=True) + 1e-12)
+    query = query / (np.linalg.norm(query) + 1e-12)
+
+    relevance = candidates @ query
+    similarity = candidates @ candidates.T
+
+    selected = [int(np.argmax(relevance))]
+    redundancy = similarity[selected[0]].copy()
+    available = np.ones(len(candidates), dtype=bool)
+    available[selected[0]] = False
+
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        index = int(np.argmax(scores))
+        selected.append(index)
+        available[index] = False
+        np.maximum(redundancy, similarity[index], out=redundancy)
+
+    return selected
+
+def mmr_search(
+    collection,
+    query_embedding: list[float],
+    k: int = 3,
+    fetch_k: int = 10,
+    lambda_mult: float = 0.7,
+    where: Optional[dict] = None,
+    load_full_embeddings: Optional[Callable[[list[str]], Optional[np.ndarray]]] = None,
+) -> list[Document]:
+    """Fetch the top `fetch_k` chunks with their embeddings in one Chroma query and rerank them locally with MMR.
+
+    Chroma may only index a prefix of each embedding. With `load_full_embeddings(ids)`, more
+    candidates are fetched and the best `fetch_k` are picked and reranked by their full embeddings.
+    """
+    return mmr_search_many(collection, [query_embedding], k, fetch_k, lambda_mult, where, load_full_embeddings)[0]
+
+def mmr_search_many(
+    collection,
+    query_embeddings: list[list[float]],
+    k: int = 3,
+    fetch_k: int = 10,
+    lambda_mult: float = 0.7,
+    where: Optional[dict] = None,
+    load_full_embeddings: Optional[Callable[[list[str]], Optional[np.ndarray]]] = None,
+) -> list[list[Document]]:
+    """`mmr_search` for several queries with a single Chroma query."""
+    index_queries = index_embeddings(query_embeddings)
+    results = collection.query(
+        query_embeddings=index_queries,
+        n_results=fetch_k * RESCORE_OVERSAMPLING if load_full_embeddings else fetch_k,
+        where=where,
+        include=["documents", "metadatas", "embeddings"],
+    )
+    return [
+        rerank_candidates(
+            query_embeddings[row],
+            index_queries[row],
+            results["ids"][row],
+            results["documents"][row],
+            results["metadatas"][row],
+            results["embeddings"][row],
+            k,
+            fetch_k,
+            lambda_mult,
+            load_full_embeddings,
+        )
+        for row in range(len(query_embeddings))
+    ]
+
+def rerank_candidates(
+    query_embedding,
+    index_query,
+    ids: list[str],
+    documents: list[str],
+    metadatas: list[dict],
+    indexed_embeddings,
+    k: int,
+    fetch_k: int,
+    lambda_mult: float,
+    load_full_embeddings=None,
+) -> list[Document]:
+    """MMR over one query's Chroma candidates, rescored by their full embeddings when available."""
+    if not documents:
+        return []
+
+    full_embeddings = load_full_embeddings(ids) if load_full_embeddings else None
+    if full_embeddings is None:
+        # Chroma returns the nearest candidates first
+        order = list(range(min(fetch_k, len(ids))))
+        query, candidate_embeddings = index_query, indexed_embeddings[:fetch_k]
+    else:
+        full_embeddings = full_embeddings / (np.linalg.norm(full_embeddings, axis=1, keepdims=True) + 1e-12)
+        order = np.argsort(-(full_embeddings @ np.asarray(query_embedding, dtype=np.float32)))[:fetch_k].tolist()
+        query, candidate_embeddings = query_embedding, full_embeddings[order]
+
+    selected = [order[i] for i in mmr_select(query, candidate_embeddings, k, lambda_mult)]
+    return [Document(id=ids[i], page_content=documents[i], metadata=metadatas[i] or {}) for i in selected]
@@ -0,0 +1,252 @@
+import io
+import os
+import json
+import tempfile
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pypdf import PdfReader
+from langchain_core.documents import Document
+from app.config import PARSED_DOCUMENT_TTL, PDF_PARSE_WORKERS, PDF_PAGES_PER_TASK, PDF_PAGE_WINDOW
+from app.clients import get_redis
+from app.services.blobStore import blob_path, open_blob
+from app.services.metrics import timed, tokens_total
+from app.services.tokenCount import TokenBudget
+from typing import Iterator, Union
+
+MAX_DOCUMENT_TOKENS = 100000
+
+# Reader kept open by each parser process between page ranges of the same file
+_open_reader = None
+
+def parse_document(file_type: str, blob_ref: str) -> dict:
+    """Parse an upload once: pages, combined text and total token count."""
+    with timed("parse"):
+        documents = load_document_from_blob(file_type, blob_ref)
+    if not documents:
+        raise ValueError("No documents found to process")
+
+    # Check document size page by page, stopping as soon as the limit is crossed
+    budget = TokenBudget(MAX_DOCUMENT_TOKENS)
+    try:
+        with timed("token_count"):
+            for doc in documents:
+                budget.add(doc.page_content)
+    finally:
+        tokens_total.labels(stage="parse").inc(budget.total)
+    num_tokens = budget.total
+    print(f"Parsed document: {len(documents)} pages, {num_tokens} tokens")
+
+    # Combine all pages' content
+    full_text = "\n\n".join(doc.page_content for doc in documents)
+
+    return {
+        "documents": documents,
+        "full_text": full_text,
+        "num_tokens": num_tokens,
+    }
+
+def parsed_document_key(key: str) -> str:
+    return f"parsed_document:{key}"
+
+def parsed_pages_key(key: str) -> str:
+    return f"parsed_pages:{key}"
+
+def _page_payload(doc: Document) -> str:
+    return json.dumps({"page_content": doc.page_content, "metadata": doc.metadata})
+
+def save_parsed_document(key: str, parsed: dict):
+    """Store a parsed document in Redis for the downstream tasks."""
+    pipe = get_redis().pipeline()
+    pipe.delete(parsed_pages_key(key))
+    pipe.rpush(parsed_pages_key(key), *[_page_payload(doc) for doc in parsed["documents"]])
+    pipe.expire(parsed_pages_key(key), PARSED_DOCUMENT_TTL)
+    pipe.set(parsed_document_key(key), json.dumps({"num_tokens": parsed["num_tokens"]}), ex=PARSED_DOCUMENT_TTL)
+    pipe.execute()
+
+def reset_parsed_document(key: str):
+    """Drop a stored parsed document, e.g. before it is stored again page by page."""
+    get_redis().delete(parsed_document_key(key), parsed_pages_key(key))
+
+def append_parsed_page(key: str, page: Document):
+    """Add one page to a parsed document that is still being parsed."""
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.rpush(parsed_pages_key(key), _page_payload(page))
+    pipe.expire(parsed_pages_key(key), PARSED_DOCUMENT_TTL)
+    pipe.execute()
+
+def finish_parsed_document(key: str, num_tokens: int):
+    """Mark a document stored page by page with `append_parsed_page` as complete."""
+    get_redis().set(parsed_document_key(key), json.dumps({"num_tokens": num_tokens}), ex=PARSED_DOCUMENT_TTL)
+
+def _load_pages(key: str) -> tuple[list[dict], int]:
+    payload = get_redis().get(parsed_document_key(key))
+    pages = get_redis().lrange(parsed_pages_key(key), 0, -1)
+    if payload is None or not pages:
+        raise ValueError("Parsed document has expired, please upload the document again")
+    return [json.loads(page) for page in pages], json.loads(payload)["num_tokens"]
+
+def load_parsed_document(key: str) -> dict:
+    """Load a parsed document stored by `save_parsed_document` or page by page."""
+    pages, num_tokens = _load_pages(key)
+    documents = [Document(page_content=page["page_content"], metadata=page["metadata"]) for page in pages]
+    return {
+        "documents": documents,
+        "full_text": "\n\n".join(doc.page_content for doc in documents),
+        "num_tokens": num_tokens,
+    }
+
+def load_parsed_text(key: str) -> str:
+    """Combined text of a stored parsed document, without building its pages."""
+    pages, _ = _load_pages(key)
+    return "\n\n".join(page["page_content"] for page in pages)
+
+def count_pdf_pages(blob_ref: str) -> int:
+    """Number of pages in a PDF blob, read from the page tree without extracting any text."""
+    path = blob_path(blob_ref)
+    if path is not None:
+        with open(path, 'rb') as f:
+            return len(PdfReader(f).pages)
+    with open_blob(blob_ref) as content:
+        return len(PdfReader(io.BytesIO(content)).pages)
+
+def iter_pdf_pages(blob_ref: str) -> Iterator[Document]:
+    """Yield the pages of a PDF blob in order while later pages are parsed in a process pool.
+
+    At most PDF_PAGE_WINDOW pages are parsed ahead of the consumer, so memory is bounded
+    by that window rather than by the size of the document.
+    """
+    path, temp_path = blob_path(blob_ref), None
+    if path is None:
+        # Redis blobs need a file the parser processes can open
+        with open_blob(blob_ref) as content, tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
+            temp_file.write(content)
+            path = temp_path = temp_file.name
+    elif not os.path.exists(path):
+        raise ValueError("Uploaded document has expired, please upload it again")
+
+    try:
+        with open(path, 'rb') as f:
+            total_pages = len(PdfReader(f).pages)
+
+        ranges = [
+            (start, min(start + PDF_PAGES_PER_TASK, total_pages))
+            for start in range(0, total_pages, PDF_PAGES_PER_TASK)
+        ]
+        for start, texts in _iter_page_ranges(path, ranges):
+            for offset, text in enumerate(texts):
+                yield Document(
+                    page_content=text,
+                    metadata={"source": path, "page": start + offset, "total_pages": total_pages}
+                )
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def _iter_page_ranges(path: str, ranges: list[tuple[int, int]]) -> Iterator[tuple[int, list[str]]]:
+    """Extract page ranges in order, in a process pool when more than one range is needed."""
+    done = 0
+    # Daemonic processes (prefork Celery workers) can't start a pool of their own
+    if PDF_PARSE_WORKERS > 0 and len(ranges) > 1 and not multiprocessing.current_process().daemon:
+        window = max(1, PDF_PAGE_WINDOW // PDF_PAGES_PER_TASK)
+        executor = ProcessPoolExecutor(max_workers=PDF_PARSE_WORKERS)
+        try:
+            pending = deque(
+                (start, executor.submit(_extract_page_range, path, start, end))
+                for start, end in ranges[:window]
+            )
+            while pending:
+                start, future = pending.popleft()
+                texts = future.result()
+                if done + len(pending) + 1 < len(ranges):
+                    next_start, next_end = ranges[done + len(pending) + 1]
+                    pending.append((next_start, executor.submit(_extract_page_range, path, next_start, next_end)))
+                yield start, texts
+                done += 1
+            return
+        except (BrokenProcessPool, AssertionError, OSError) as e:
+            # The pool could not start its processes or lost one
+            print(f"PDF parser pool failed ({e!r}), parsing the remaining pages in-process")
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    with open(path, 'rb') as stream:
+        reader = PdfReader(stream)
+        for start, end in ranges[done:]:
+            yield start, [reader.pages[i].extract_text() for i in range(start, end)]
+
+def _extract_page_range(path: str, start: int, end: int) -> list[str]:
+    """Extract the text of pages [start, end). Runs inside a parser process."""
+    global _open_reader
+    if _open_reader is None or _open_reader[0] != path:
+        if _open_reader is not None:
+            _open_reader[1].close()
+        # Keep the file handle instead of reading the whole file into memory
+        stream = open(path, 'rb')
+        _open_reader = (path, stream, PdfReader(stream))
+    reader = _open_reader[2]
+    return [reader.pages[i].extract_text() for i in range(start, end)]
+
+def load_pdf(path: str) -> list[Document]:
+    # langchain_community is slow to import, so only pay for it when a PDF is loaded this way
+    from langchain_community.document_loaders import PyPDFLoader
+    return PyPDFLoader(file_path=path).load()
+
+def load_document_from_blob(file_type: str, blob_ref: str) -> list[Document]:
+    """Load documents from the blob store without copying the upload around."""
+    path = blob_path(blob_ref)
+    if file_type == 'pdf' and path is not None:
+        # Local blobs are already files, so PyPDFLoader can read them in place
+        if not os.path.exists(path):
+            raise ValueError("Uploaded document has expired, please upload it again")
+        try:
+            return load_pdf(path)
+        except Exception as e:
+            raise Exception(f"Error loading documents: {str(e)}")
+
+    with open_blob(blob_ref) as view:
+        if file_type == 'pdf':
+            return load_document_from_memory(file_type, bytes(view))
+        return load_document_from_memory(file_type, str(view, 'utf-8'))
+
+def load_document_from_memory(file_type: str, content: Union[bytes, str]) -> list[Document]:
+    """Load documents from in-memory content."""
+    documents = []
+    
+    try:
+        if file_type == 'pdf':
+            # For PDFs: use a temporary file
+            if isinstance(content, str):
+                raise ValueError("PDF content must be provided as bytes")
+                
+            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
+                temp_file.write(content)
+                temp_path = temp_file.name
+            
+            try:
+                documents = load_pdf(temp_path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            
+        elif file_type in ['txt', 'text']:
+            # For text: create Document directly from the string content
+            if isinstance(content, bytes):
+                content = content.decode('utf-8')
+                
+            documents = [Document(page_content=content, metadata={"source": "text_upload"})]
+            
+        elif file_type in ['markdown', 'md']:
+            # For markdown: create Document directly with the markdown content
+            if isinstance(content, bytes):
+                content = content.decode('utf-8')
+                
+            documents = [Document(page_content=content, metadata={"source": "markdown_upload"})]
+            
+        else:
+            raise ValueError(f"Unsupported file type: {file_type}")
+            
+        return documents
+    except Exception as e:
+        raise Exception(f"Error loading documents: {str(e)}")
@@ -0,0 +1,53 @@
+import json
+from typing import Union
+from app.config import PROGRESS_STREAM_MAXLEN, PROGRESS_STREAM_TTL
+from app.clients import get_redis
+
+def progress_channel(task_id: str) -> str:
+    return f"progress_channel:{task_id}"
+
+def progress_stream_key(task_id: str) -> str:
+    return f"progress_stream:{task_id}"
+
+def publish_progress(task_id: str, message: Union[str, dict]):
+    """Record a progress event in the task's stream and notify live subscribers.
+
+    The stream keeps the history for clients that connect late or reconnect; the
+    pub/sub message carries the stream id so subscribers can skip events they replayed.
+    """
+    if isinstance(message, dict):
+        message = json.dumps(message)
+
+    stream_key = progress_stream_key(task_id)
+    event_id = get_redis().xadd(stream_key, {"data": message}, maxlen=PROGRESS_STREAM_MAXLEN, approximate=True)
+    if isinstance(event_id, bytes):
+        event_id = event_id.decode()
+
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.expire(stream_key, PROGRESS_STREAM_TTL)
+    pipe.publish(progress_channel(task_id), json.dumps({"id": event_id, "data": message}))
+    pipe.execute()
+
+class UploadCompletion:
+    """Follows a task's progress events: an upload is finished once both its vectors and
+    its summary are done, which happen in separate tasks and in either order, or on an error."""
+
+    def __init__(self):
+        self.vectors_ready = False
+        self.summary_ready = False
+
+    def update(self, message: str) -> bool:
+        """Record one event; True once the task's progress stream is complete."""
+        try:
+            payload = json.loads(message)
+        except (TypeError, ValueError):
+            return False
+        if not isinstance(payload, dict):
+            return False
+        if payload.get("status") == "error":
+            return True
+        if payload.get("vectorsReady"):
+            self.vectors_ready = True
+        if "summary" in payload and "title" in payload:
+            self.summary_ready = True
+        return self.vectors_ready and self.summary_ready
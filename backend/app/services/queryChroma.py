@@ -1,38 +1,30 @@
-import chromadb
-from langchain_community.vectorstores.chroma import Chroma
-from langchain.chains import RetrievalQA
-from langchain.prompts import PromptTemplate
-from app.config import embeddings, llm
+import threading
+from cachetools import TTLCache
+from langchain_core.prompts import PromptTemplate
+from langchain_core.documents import Document
+from app.clients import get_chroma_client, get_llm
+from app.config import QUERY_HANDLE_CACHE_SIZE, QUERY_HANDLE_CACHE_TTL, HYBRID_RETRIEVAL, CHAT_BATCH_MAX_CONCURRENCY
+from app.services.collectionState import get_collection_generation, touch_collection, document_id_prefix
+from app.services.embeddingCache import embed_query_cached, embed_documents_cached
+from app.services.semanticCache import lookup_answer, store_answer
+from app.services.mmrSearch import mmr_search_many
+from app.services.compactVectors import RESCORING, is_current_collection, load_rescore_vectors
+from app.services.collectionLifecycle import evict_collection
+from app.services.lexicalIndex import BM25Index, load_lexical_index, reciprocal_rank_fusion
+from app.services.contextPacking import CONTEXT_SEPARATOR, assemble_context
+from app.services.metrics import timed, tokens_total
+from typing import Iterator, Optional
 
-chroma_client = chromadb.HttpClient(host='localhost', port=8000)
+SESSION_EXPIRED_ANSWER = "Sorry, your session has expired or no documents were found. Please upload a new document."
+NO_INFORMATION_ANSWER = "I don't have enough information in the document to answer this question."
+QUERY_ERROR_ANSWER = "I encountered an error while searching for information. Please try rephrasing your question."
 
-def query_chroma(question: str, user_id: str):
-    """Query the user's Chroma database with a question."""
-    try:
-        collection_name = f"user_{user_id}_docs"
-        
-        try:
-            collection = chroma_client.get_collection(name=collection_name)
-        except Exception:
-            return {
-                "answer": "Sorry, your session has expired or no documents were found. Please upload a new document.",
-                "sources": []
-            }
+# MMR retrieval defaults, overridable per request
+DEFAULT_K = 3
+DEFAULT_FETCH_K = 10
+DEFAULT_LAMBDA_MULT = 0.7
 
-        
-        db = Chroma(
-            client=chroma_client,
-            collection_name=collection_name,
-            embedding_function=embeddings
-        )
-
-        retriever = db.as_retriever(
-            search_type="mmr",
-            search_kwargs={"k": 3, "fetch_k": 10, "lambda_mult": 0.7}
-        )
-
-        
-        template = """
+QA_TEMPLATE = """
         You are an AI assistant answering questions about specific documents.
 
         Answer the user's question based ONLY on the following context. If the context doesn't contain the information needed to answer the question, say "I don't have enough information in the document to answer this question." DO NOT make up or infer information not present in the context.
@@ -46,39 +38,316 @@ def query_chroma(question: str, user_id: str):
         Answer in a clear, direct manner. If quoting from the document, make it clear which part you're referencing. Only include information relevant to the question.
         """
 
-        prompt = PromptTemplate(
-            template=template,
-            input_variables=["context", "question"]
-        )
-
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=retriever,
-            return_source_documents=True,
-            chain_type_kwargs={"prompt": prompt}
-        )
-
-        result = qa_chain.invoke({"query": question})
-
-        sources = []
-        seen = set()
-        for doc in result.get("source_documents", []):
-            if doc.page_content not in seen:
-                seen.add(doc.page_content)
-                sources.append({
-                    "content": doc.page_content,
-                    "metadata": doc.metadata
-                })
+qa_prompt = PromptTemplate(
+    template=QA_TEMPLATE,
+    input_variables=["context", "question"]
+)
 
-        return {
-            "answer": result["result"],
-            "sources": sources
+class QueryHandle:
+    """Everything needed to query one user's collection, built once and reused across questions."""
+
+    def __init__(self, user_id: str, collection, generation: int):
+        self.user_id = user_id
+        self.collection = collection
+        self.generation = generation
+        self._lexical_index = None
+
+    @property
+    def lexical_index(self) -> BM25Index:
+        """The user's BM25 index in Redis, checked on first use."""
+        if self._lexical_index is None:
+            self._lexical_index = load_lexical_index(self.user_id) or BM25Index(self.user_id)
+        return self._lexical_index
+
+    def full_embeddings(self, ids: list[str]):
+        """Quantized full embeddings for rescoring candidates from a compact index."""
+        return load_rescore_vectors(self.user_id, ids)
+
+# user_id -> QueryHandle, LRU bounded and expired after QUERY_HANDLE_CACHE_TTL seconds
+query_handles = TTLCache(maxsize=QUERY_HANDLE_CACHE_SIZE, ttl=QUERY_HANDLE_CACHE_TTL)
+query_handles_lock = threading.Lock()
+
+def get_query_handle(user_id: str) -> Optional[QueryHandle]:
+    """Return a warm query handle for the user, or None if the user has no collection.
+
+    Handles are dropped when the collection generation is bumped by new chunks or eviction.
+    """
+    generation = get_collection_generation(user_id)
+    with query_handles_lock:
+        handle = query_handles.get(user_id)
+    if handle is not None and handle.generation == generation:
+        touch_collection(user_id)
+        return handle
+
+    collection_name = f"user_{user_id}_docs"
+    
+    try:
+        collection = get_chroma_client().get_collection(name=collection_name)
+        if not is_current_collection(collection):
+            # Built with other index dimensions, so the question embeddings no longer fit
+            evict_collection(user_id)
+            raise LookupError(collection_name)
+    except Exception:
+        with query_handles_lock:
+            query_handles.pop(user_id, None)
+        return None
+
+    handle = QueryHandle(user_id, collection, generation)
+    with query_handles_lock:
+        query_handles[user_id] = handle
+    touch_collection(user_id)
+    return handle
+
+def collection_was_evicted(user_id: str) -> bool:
+    """Whether a failed query ran against a collection that is gone.
+
+    The cached handle is dropped first, so the collection is looked up again even when
+    it disappeared without a generation bump (e.g. a Chroma restart).
+    """
+    with query_handles_lock:
+        query_handles.pop(user_id, None)
+    try:
+        return get_query_handle(user_id) is None
+    except Exception:
+        return False
+
+def retrieve_documents(
+    handle: QueryHandle,
+    question: str,
+    question_embedding: list[float],
+    k: int = DEFAULT_K,
+    fetch_k: int = DEFAULT_FETCH_K,
+    lambda_mult: float = DEFAULT_LAMBDA_MULT,
+    document_id: Optional[str] = None,
+) -> list[Document]:
+    """Retrieve the chunks relevant to an already embedded question.
+
+    Vector candidates are ranked with MMR and, with hybrid retrieval, fused with the
+    BM25 keyword ranking so exact terms (names, codes, section numbers) are not missed.
+    With `document_id`, only that uploaded document's chunks are searched.
+    """
+    return retrieve_documents_many(handle, [question], [question_embedding], k, fetch_k, lambda_mult, document_id)[0]
+
+def retrieve_documents_many(
+    handle: QueryHandle,
+    questions: list[str],
+    question_embeddings: list[list[float]],
+    k: int = DEFAULT_K,
+    fetch_k: int = DEFAULT_FETCH_K,
+    lambda_mult: float = DEFAULT_LAMBDA_MULT,
+    document_id: Optional[str] = None,
+) -> list[list[Document]]:
+    """`retrieve_documents` for several questions, with one Chroma query for all of their vector candidates."""
+    fetch_k = max(k, fetch_k)
+    where = {"document_id": document_id} if document_id else None
+    rescore = handle.full_embeddings if RESCORING else None
+    if not HYBRID_RETRIEVAL:
+        return mmr_search_many(handle.collection, question_embeddings, k, fetch_k, lambda_mult, where, rescore)
+
+    # Rank every vector candidate with MMR so the fusion sees the full list
+    vector_results = mmr_search_many(handle.collection, question_embeddings, fetch_k, fetch_k, lambda_mult, where, rescore)
+    id_prefix = document_id_prefix(handle.user_id, document_id) if document_id else ""
+
+    rankings = []
+    documents_by_id = {}
+    for question, vector_documents in zip(questions, vector_results):
+        documents_by_id.update((doc.id, doc) for doc in vector_documents)
+        lexical_hits = handle.lexical_index.search(question, fetch_k, id_prefix)
+        if not lexical_hits:
+            rankings.append([doc.id for doc in vector_documents[:k]])
+            continue
+        rankings.append(reciprocal_rank_fusion([
+            [doc.id for doc in vector_documents],
+            [doc_id for doc_id, _ in lexical_hits],
+        ])[:k])
+
+    # Keyword-only hits of every question are fetched together
+    missing_ids = list(dict.fromkeys(doc_id for ranking in rankings for doc_id in ranking if doc_id not in documents_by_id))
+    if missing_ids:
+        results = handle.collection.get(ids=missing_ids, include=["documents", "metadatas"])
+        for doc_id, text, metadata in zip(results["ids"], results["documents"], results["metadatas"]):
+            documents_by_id[doc_id] = Document(id=doc_id, page_content=text, metadata=metadata or {})
+
+    return [[documents_by_id[doc_id] for doc_id in ranking if doc_id in documents_by_id] for ranking in rankings]
+
+def pack_retrieved_context(documents: list[Document]) -> list[Document]:
+    """Merge neighbouring chunks and keep the best passages that fit the context token budget."""
+    with timed("context_packing"):
+        passages, context_tokens = assemble_context(documents)
+    tokens_total.labels(stage="context").inc(context_tokens)
+    return passages
+
+def build_prompt(question: str, documents: list[Document]) -> str:
+    """Put the packed passages into the QA prompt."""
+    context = CONTEXT_SEPARATOR.join(doc.page_content for doc in documents)
+    return qa_prompt.format(context=context, question=question)
+
+def format_sources(documents: list[Document]) -> list[dict]:
+    """Unique source chunks in retrieval order."""
+    sources = []
+    seen = set()
+    for doc in documents:
+        if doc.page_content not in seen:
+            seen.add(doc.page_content)
+            sources.append({
+                "content": doc.page_content,
+                "metadata": doc.metadata
+            })
+    return sources
+
+def query_chroma(
+    question: str,
+    user_id: str,
+    k: int = DEFAULT_K,
+    fetch_k: int = DEFAULT_FETCH_K,
+    lambda_mult: float = DEFAULT_LAMBDA_MULT,
+    document_id: Optional[str] = None,
+):
+    """Query the user's Chroma database with a question, optionally within one uploaded document."""
+    try:
+        with timed("query_handle"):
+            handle = get_query_handle(user_id)
+        if handle is None:
+            return {
+                "answer": SESSION_EXPIRED_ANSWER,
+                "sources": []
+            }
+
+        with timed("query_embed"):
+            question_embedding = embed_query_cached(question)
+        retrieval_variant = f"{k}:{fetch_k}:{lambda_mult}:{document_id or ''}"
+        cached = lookup_answer(user_id, handle.generation, question_embedding, retrieval_variant)
+        if cached is not None:
+            return cached
+
+        with timed("retrieval"):
+            documents = retrieve_documents(handle, question, question_embedding, k, fetch_k, lambda_mult, document_id)
+        documents = pack_retrieved_context(documents)
+        with timed("llm_answer"):
+            answer = get_llm().invoke(build_prompt(question, documents))
+
+        result = {
+            "answer": answer.content,
+            "sources": format_sources(documents)
         }
+        store_answer(user_id, handle.generation, question_embedding, result["answer"], result["sources"], retrieval_variant)
+        return result
 
     except Exception as e:
         print(f"Error querying Chroma: {str(e)}")
+        if collection_was_evicted(user_id):
+            return {
+                "answer": SESSION_EXPIRED_ANSWER,
+                "sources": []
+            }
         return {
-            "answer": "I encountered an error while searching for information. Please try rephrasing your question.",
+            "answer": QUERY_ERROR_ANSWER,
             "sources": []
         }
+
+def query_chroma_batch(
+    questions: list[str],
+    user_id: str,
+    k: int = DEFAULT_K,
+    fetch_k: int = DEFAULT_FETCH_K,
+    lambda_mult: float = DEFAULT_LAMBDA_MULT,
+    document_id: Optional[str] = None,
+) -> list[dict]:
+    """Answer several questions about the user's documents, returning the results in question order.
+
+    All questions are embedded in one request and searched with one Chroma query; the
+    LLM answers run concurrently.
+    """
+    try:
+        with timed("query_handle"):
+            handle = get_query_handle(user_id)
+        if handle is None:
+            return [{"answer": SESSION_EXPIRED_ANSWER, "sources": []} for _ in questions]
+
+        with timed("query_embed"):
+            question_embeddings = embed_documents_cached(questions)
+        retrieval_variant = f"{k}:{fetch_k}:{lambda_mult}:{document_id or ''}"
+        results = [
+            lookup_answer(user_id, handle.generation, embedding, retrieval_variant)
+            for embedding in question_embeddings
+        ]
+
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not pending:
+            return results
+
+        with timed("retrieval"):
+            retrieved = retrieve_documents_many(
+                handle,
+                [questions[i] for i in pending],
+                [question_embeddings[i] for i in pending],
+                k, fetch_k, lambda_mult, document_id,
+            )
+        passages = [pack_retrieved_context(documents) for documents in retrieved]
+        prompts = [build_prompt(questions[i], documents) for i, documents in zip(pending, passages)]
+        with timed("llm_batch"):
+            answers = get_llm().batch(prompts, config={"max_concurrency": CHAT_BATCH_MAX_CONCURRENCY}, return_exceptions=True)
+
+        for i, documents, answer in zip(pending, passages, answers):
+            if isinstance(answer, Exception):
+                print(f"Error answering question: {str(answer)}")
+                results[i] = {"answer": QUERY_ERROR_ANSWER, "sources": []}
+                continue
+            results[i] = {"answer": answer.content, "sources": format_sources(documents)}
+            store_answer(user_id, handle.generation, question_embeddings[i], results[i]["answer"], results[i]["sources"], retrieval_variant)
+        return results
+
+    except Exception as e:
+        print(f"Error querying Chroma: {str(e)}")
+        answer = SESSION_EXPIRED_ANSWER if collection_was_evicted(user_id) else QUERY_ERROR_ANSWER
+        return [{"answer": answer, "sources": []} for _ in questions]
+
+def stream_query_chroma(
+    question: str,
+    user_id: str,
+    k: int = DEFAULT_K,
+    fetch_k: int = DEFAULT_FETCH_K,
+    lambda_mult: float = DEFAULT_LAMBDA_MULT,
+    document_id: Optional[str] = None,
+) -> Iterator[dict]:
+    """Query the user's Chroma database, yielding the sources first and then the answer token by token."""
+    try:
+        with timed("query_handle"):
+            handle = get_query_handle(user_id)
+        if handle is None:
+            yield {"type": "sources", "sources": []}
+            yield {"type": "done", "answer": SESSION_EXPIRED_ANSWER}
+            return
+
+        with timed("query_embed"):
+            question_embedding = embed_query_cached(question)
+        retrieval_variant = f"{k}:{fetch_k}:{lambda_mult}:{document_id or ''}"
+        cached = lookup_answer(user_id, handle.generation, question_embedding, retrieval_variant)
+        if cached is not None:
+            yield {"type": "sources", "sources": cached["sources"]}
+            yield {"type": "token", "content": cached["answer"]}
+            yield {"type": "done", "answer": cached["answer"]}
+            return
+
+        with timed("retrieval"):
+            documents = retrieve_documents(handle, question, question_embedding, k, fetch_k, lambda_mult, document_id)
+        documents = pack_retrieved_context(documents)
+        sources = format_sources(documents)
+        yield {"type": "sources", "sources": sources}
+
+        answer = ""
+        with timed("llm_stream"):
+            for chunk in get_llm().stream(build_prompt(question, documents)):
+                if chunk.content:
+                    answer += chunk.content
+                    yield {"type": "token", "content": chunk.content}
+
+        store_answer(user_id, handle.generation, question_embedding, answer, sources, retrieval_variant)
+        yield {"type": "done", "answer": answer}
+
+    except Exception as e:
+        print(f"Error querying Chroma: {str(e)}")
+        if collection_was_evicted(user_id):
+            yield {"type": "done", "answer": SESSION_EXPIRED_ANSWER}
+            return
+        yield {"type": "error", "message": QUERY_ERROR_ANSWER}
@@ -0,0 +1,97 @@
+import time
+import redis
+from typing import Optional
+from app.clients import get_redis
+from app.services.metrics import record_cache
+
+class RedisLRUCache:
+    """Size-bounded Redis cache with a sliding TTL and least-recently-used eviction.
+
+    Values live under `{namespace}:{key}`. A sorted set scored by last access time
+    tracks every entry so the oldest ones can be dropped once `max_entries` is exceeded.
+    """
+
+    def __init__(self, namespace: str, max_entries: int, ttl: int, client: Optional[redis.StrictRedis] = None):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._client = client
+        self.index_key = f"{namespace}:__index__"
+        self.hits_key = f"{namespace}:__hits__"
+        self.misses_key = f"{namespace}:__misses__"
+
+    @property
+    def client(self) -> redis.StrictRedis:
+        return self._client or get_redis()
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key])[0]
+
+    def set(self, key: str, value: bytes):
+        self.set_many({key: value})
+
+    def get_many(self, keys: list[str]) -> list[Optional[bytes]]:
+        """Fetch several entries at once, refreshing the TTL and recency of every hit."""
+        if not keys:
+            return []
+
+        values = self.client.mget([self._key(k) for k in keys])
+        now = time.time()
+        hits = [k for k, v in zip(keys, values) if v is not None]
+
+        pipe = self.client.pipeline(transaction=False)
+        for key in hits:
+            pipe.expire(self._key(key), self.ttl)
+        if hits:
+            pipe.zadd(self.index_key, {key: now for key in hits})
+            pipe.incrby(self.hits_key, len(hits))
+        if len(hits) < len(keys):
+            pipe.incrby(self.misses_key, len(keys) - len(hits))
+        pipe.execute()
+        record_cache(self.namespace, hits=len(hits), misses=len(keys) - len(hits))
+
+        return values
+
+    def set_many(self, mapping: dict[str, bytes]):
+        """Store several entries at once and evict the least recently used ones if over budget."""
+        if not mapping:
+            return
+
+        now = time.time()
+        pipe = self.client.pipeline(transaction=False)
+        for key, value in mapping.items():
+            pipe.set(self._key(key), value, ex=self.ttl)
+        pipe.zadd(self.index_key, {key: now for key in mapping})
+        pipe.execute()
+
+        self._evict(now)
+
+    def _evict(self, now: float):
+        # Entries that expired through their TTL only need to leave the index
+        self.client.zremrangebyscore(self.index_key, "-inf", now - self.ttl)
+
+        overflow = self.client.zcard(self.index_key) - self.max_entries
+        if overflow <= 0:
+            return
+
+        oldest = [k.decode() for k in self.client.zrange(self.index_key, 0, overflow - 1)]
+        if oldest:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.delete(*[self._key(k) for k in oldest])
+            pipe.zrem(self.index_key, *oldest)
+            pipe.execute()
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the current number of entries."""
+        hits, misses = self.client.mget([self.hits_key, self.misses_key])
+        hits, misses = int(hits or 0), int(misses or 0)
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+            "entries": self.client.zcard(self.index_key),
+        }
@@ -0,0 +1,90 @@
+import json
+import base64
+import numpy as np
+import redis
+from typing import Optional
+from app.config import SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES, SEMANTIC_CACHE_TTL
+from app.clients import get_redis
+from app.services.metrics import record_cache
+
+HITS_KEY = "semantic_cache:__hits__"
+MISSES_KEY = "semantic_cache:__misses__"
+
+def semantic_cache_key(user_id: str, generation: int, variant: str = "") -> str:
+    # Entries are versioned by collection generation, so new uploads start from an empty cache.
+    # `variant` separates answers produced with different retrieval settings.
+    return f"semantic_cache:{user_id}:{generation}:{variant}"
+
+def _encode_embedding(embedding: list[float]) -> str:
+    return base64.b64encode(np.asarray(embedding, dtype=np.float32).tobytes()).decode('ascii')
+
+def _decode_embedding(encoded: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(encoded), dtype=np.float32)
+
+def lookup_answer(user_id: str, generation: int, question_embedding: list[float], variant: str = "") -> Optional[dict]:
+    """Return the cached answer for the most similar earlier question above the similarity threshold."""
+    key = semantic_cache_key(user_id, generation, variant)
+    try:
+        raw_entries = get_redis().lrange(key, 0, -1)
+        best_index, best_score = None, SEMANTIC_CACHE_THRESHOLD
+        if raw_entries:
+            entries = [json.loads(raw) for raw in raw_entries]
+            embeddings = [_decode_embedding(entry["embedding"]) for entry in entries]
+            query = np.asarray(question_embedding, dtype=np.float32)
+            # Questions embedded before EMBEDDING_DIMENSIONS changed can't be compared
+            comparable = [i for i, embedding in enumerate(embeddings) if embedding.shape == query.shape]
+            if comparable:
+                matrix = np.stack([embeddings[i] for i in comparable])
+                scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+                index = int(np.argmax(scores))
+                if scores[index] >= best_score:
+                    best_index, best_score = comparable[index], float(scores[index])
+
+        if best_index is None:
+            get_redis().incr(MISSES_KEY)
+            record_cache("semantic_cache", misses=1)
+            return None
+
+        # Move the hit to the front so the least recently used entries are trimmed first
+        pipe = get_redis().pipeline()
+        pipe.lrem(key, 1, raw_entries[best_index])
+        pipe.lpush(key, raw_entries[best_index])
+        pipe.expire(key, SEMANTIC_CACHE_TTL)
+        pipe.incr(HITS_KEY)
+        pipe.execute()
+        record_cache("semantic_cache", hits=1)
+
+        entry = entries[best_index]
+        print(f"Semantic cache hit (similarity {best_score:.3f})")
+        return {"answer": entry["answer"], "sources": entry["sources"]}
+    except redis.RedisError as e:
+        print(f"Semantic cache unavailable: {str(e)}")
+        return None
+
+def store_answer(user_id: str, generation: int, question_embedding: list[float], answer: str, sources: list[dict], variant: str = ""):
+    """Cache an answer, keeping at most SEMANTIC_CACHE_MAX_ENTRIES per user."""
+    key = semantic_cache_key(user_id, generation, variant)
+    entry = json.dumps({
+        "embedding": _encode_embedding(question_embedding),
+        "answer": answer,
+        "sources": sources,
+    })
+    try:
+        pipe = get_redis().pipeline()
+        pipe.lpush(key, entry)
+        pipe.ltrim(key, 0, SEMANTIC_CACHE_MAX_ENTRIES - 1)
+        pipe.expire(key, SEMANTIC_CACHE_TTL)
+        pipe.execute()
+    except redis.RedisError as e:
+        print(f"Failed to store semantic cache entry: {str(e)}")
+
+def semantic_cache_stats() -> dict:
+    """Hit/miss counters for the semantic answer cache."""
+    hits, misses = get_redis().mget([HITS_KEY, MISSES_KEY])
+    hits, misses = int(hits or 0), int(misses or 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / total if total else 0.0,
+    }
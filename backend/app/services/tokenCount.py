@@ -0,0 +1,49 @@
+import tiktoken
+from functools import lru_cache
+from typing import Iterator
+from app.config import LLM_MODEL
+
+# Long texts are counted in slices of this many characters so that an oversized
+# document is rejected without encoding all of it
+COUNT_SLICE_CHARS = 64 * 1024
+
+@lru_cache(maxsize=1)
+def get_encoding() -> tiktoken.Encoding:
+    """The chat model's tokenizer, loaded once per process."""
+    try:
+        return tiktoken.encoding_for_model(LLM_MODEL)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+def count_tokens(text: str) -> int:
+    """Number of tokens the chat model sees for `text`."""
+    return len(get_encoding().encode_ordinary(text))
+
+def iter_slices(text: str, size: int = COUNT_SLICE_CHARS) -> Iterator[str]:
+    """Cut text into pieces of about `size` characters, just before a space where possible."""
+    start = 0
+    while len(text) - start > size:
+        end = text.rfind(" ", start + size // 2, start + size)
+        if end == -1:
+            end = start + size
+        yield text[start:end]
+        start = end
+    yield text[start:]
+
+class TokenBudget:
+    """Running token count over a document that raises as soon as `limit` is crossed."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.total = 0
+
+    def add(self, text: str) -> int:
+        """Count `text` into the budget and return its token count."""
+        added = 0
+        for piece in iter_slices(text):
+            tokens = count_tokens(piece)
+            added += tokens
+            self.total += tokens
+            if self.total > self.limit:
+                raise ValueError("Document is too large to process")
+        return added
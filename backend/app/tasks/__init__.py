@@ -1,8 +1,13 @@
-from .chroma_tasks import create_chroma_db, create_document_summary
+from .chroma_tasks import parse_document, create_chroma_db, ingest_pdf_stream, create_document_summary, start_document_processing, evict_idle_collections, queue_probe
 from .celery_config import celery_app
 
 __all__ = [
     'celery_app',
+    'parse_document',
     'create_chroma_db',
+    'ingest_pdf_stream',
     'create_document_summary',
+    'start_document_processing',
+    'evict_idle_collections',
+    'queue_probe',
 ] 
\ No newline at end of file
@@ -1,16 +1,69 @@
 from celery import Celery
+from celery.signals import worker_init, worker_process_shutdown
+from prometheus_client import start_http_server
+from app.config import CELERY_METRICS_PORT, COLLECTION_EVICTION_INTERVAL, REDIS_URL
+from app.services.metrics import metrics_registry, mark_process_dead
 
 celery_app = Celery(
     "document_processor",
-    broker="redis://localhost:6379/0",
+    broker=REDIS_URL,
 )
 
+INGEST_QUEUE = 'ingest'
+SUMMARY_QUEUE = 'summary'
+QUERY_QUEUE = 'query'
+
+# Redis priorities: 0 is served first. Vector indexing unblocks chat, so it goes ahead of anything else
+HIGH_PRIORITY = 0
+DEFAULT_PRIORITY = 5
+LOW_PRIORITY = 9
+
 celery_app.conf.update(
-    result_backend="redis://localhost:6379/0",
+    result_backend=REDIS_URL,
     task_time_limit=600,  # 10 minutes
     task_serializer='json',
     accept_content=['json'],
     result_serializer='json',
     timezone='UTC',
     enable_utc=True,
-) 
\ No newline at end of file
+    task_default_queue=INGEST_QUEUE,
+    task_default_priority=DEFAULT_PRIORITY,
+    task_routes={
+        'app.tasks.chroma_tasks.parse_document': {'queue': INGEST_QUEUE},
+        'app.tasks.chroma_tasks.create_chroma_db': {'queue': INGEST_QUEUE},
+        'app.tasks.chroma_tasks.ingest_pdf_stream': {'queue': INGEST_QUEUE},
+        'app.tasks.chroma_tasks.evict_idle_collections': {'queue': INGEST_QUEUE},
+        'app.tasks.chroma_tasks.create_document_summary': {'queue': SUMMARY_QUEUE},
+        'app.tasks.chroma_tasks.query_chroma': {'queue': QUERY_QUEUE},
+        'app.tasks.chroma_tasks.queue_probe': {'queue': QUERY_QUEUE},
+    },
+    # Each priority level is its own Redis list; a worker consuming several queues drains
+    # them in the order given to -Q instead of round robin
+    broker_transport_options={
+        'priority_steps': list(range(10)),
+        'sep': ':',
+        'queue_order_strategy': 'priority',
+    },
+    # Tasks run for seconds to minutes, so don't let a busy worker hoard messages
+    worker_prefetch_multiplier=1,
+    beat_schedule={
+        'evict-idle-collections': {
+            'task': 'app.tasks.chroma_tasks.evict_idle_collections',
+            'schedule': COLLECTION_EVICTION_INTERVAL,
+        },
+    },
+)
+
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    # Workers don't serve HTTP, so expose their stage metrics on a separate port
+    try:
+        # Prefork tasks run in child processes, which only show up with PROMETHEUS_MULTIPROC_DIR
+        start_http_server(CELERY_METRICS_PORT, registry=metrics_registry())
+        print(f"Worker metrics available on :{CELERY_METRICS_PORT}/metrics")
+    except OSError as e:
+        print(f"Worker metrics not exported, port {CELERY_METRICS_PORT} is taken ({e}); set CELERY_METRICS_PORT per worker")
+
+@worker_process_shutdown.connect
+def forget_worker_process(pid=None, **kwargs):
+    mark_process_dead(pid)
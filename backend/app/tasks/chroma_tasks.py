@@ -1,29 +1,84 @@
-import redis
-import json
-from .celery_config import celery_app
+import time
+from celery import chain, group
+from .celery_config import celery_app, HIGH_PRIORITY, DEFAULT_PRIORITY, LOW_PRIORITY
+from app.config import PDF_STREAMING, INGEST_TASK_TIME_LIMIT, SUMMARY_TASK_TIME_LIMIT, QUERY_TASK_TIME_LIMIT
+from app.services.parseDocument import parse_document as parse_document_service
+from app.services.parseDocument import save_parsed_document, load_parsed_document, load_parsed_text, iter_pdf_pages
 from app.services.createChroma import create_chroma_db as create_chroma_db_service
+from app.services.createChroma import create_chroma_db_streaming
 from app.services.createSummary import create_document_summary as create_document_summary_service
-from app.services.createSummary import create_title
+from app.services.createSummary import create_title, get_cached_summary, cache_summary
 from app.services.queryChroma import query_chroma as query_chroma_service
-from typing import Union, Optional
+from app.services.progress import publish_progress
+from app.services.collectionLifecycle import evict_idle_collections as evict_idle_collections_service
 
-# Redis setup
-redis_client = redis.StrictRedis(host='localhost', port=6379, db=0)
+def soft_limit(time_limit: int) -> int:
+    """Soft time limit raised inside the task shortly before the hard limit kills it"""
+    return max(1, time_limit - max(5, time_limit // 10))
 
-@celery_app.task(bind=True, name='app.tasks.chroma_tasks.create_chroma_db')
-def create_chroma_db(self, content: Union[bytes, str], file_type: str, task_id: str, user_id: str):
-    """Task to create Chroma DB from in-memory document content and notify frontend on progress"""
+def publish_batch_progress(task_id: str):
+    """Progress callback publishing per-batch embedding progress for a task"""
+    def publish(batches_done: int, batches_total: int, chunks_added: int):
+        publish_progress(task_id, {
+            "status": "Storing vectors...",
+            "batch": batches_done,
+            "batches": batches_total,
+            "chunks": chunks_added
+        })
+    return publish
+
+def start_document_processing(blob_ref: str, file_type: str, task_id: str, user_id: str, document_id: str):
+    """Parse the upload once, then build the vectors and the summary from the shared result"""
+    if file_type == 'pdf' and PDF_STREAMING:
+        # Pages are embedded while the rest of the PDF is parsed; the summary starts once parsing is done
+        return ingest_pdf_stream.apply_async(args=[blob_ref, task_id, user_id, document_id])
+
+    return chain(
+        parse_document.s(blob_ref, file_type, task_id),
+        group(
+            create_chroma_db.s(task_id, user_id, document_id, blob_ref),
+            create_document_summary.s(task_id, user_id),
+        ),
+    ).apply_async()
+
+@celery_app.task(bind=True, name='app.tasks.chroma_tasks.parse_document', priority=HIGH_PRIORITY,
+                 time_limit=INGEST_TASK_TIME_LIMIT, soft_time_limit=soft_limit(INGEST_TASK_TIME_LIMIT))
+def parse_document(self, blob_ref: str, file_type: str, task_id: str):
+    """Task to parse an uploaded blob once and cache the result for the downstream tasks"""
     try:
-        redis_client.publish(f"progress_channel:{task_id}", "Splitting text into vectors...")
+        parsed = parse_document_service(file_type, blob_ref)
+        save_parsed_document(task_id, parsed)
+        return task_id
+    except Exception as e:
+        error_message = str(e)
+
+        if "Document is too large to process" in error_message:
+            error_message = "Document is too large to process."
+        else:
+            error_message = f"Error parsing document: {error_message}"
+
+        publish_progress(task_id, {"status": "error", "message": error_message})
+        self.request.chain = None
+        raise Exception(error_message)
+
+@celery_app.task(bind=True, name='app.tasks.chroma_tasks.create_chroma_db', priority=HIGH_PRIORITY,
+                 time_limit=INGEST_TASK_TIME_LIMIT, soft_time_limit=soft_limit(INGEST_TASK_TIME_LIMIT))
+def create_chroma_db(self, parsed_key: str, task_id: str, user_id: str, document_id: str = None, content_hash: str = None):
+    """Task to create Chroma DB from a parsed document and notify frontend on progress"""
+    try:
+        publish_progress(task_id, "Splitting text into vectors...")
         
-        text = create_chroma_db_service(file_type, user_id, content)
+        parsed = load_parsed_document(parsed_key)
+        text = parsed["full_text"]
+        create_chroma_db_service(parsed["documents"], user_id, publish_batch_progress(task_id), document_id or task_id, content_hash)
         
-        redis_client.publish(f"progress_channel:{task_id}", "Storing vectors...")
+        publish_progress(task_id, "Storing vectors...")
         text_message = {
             "status": "Storing vectors...",
+            "vectorsReady": True,
             "text": text
         }
-        redis_client.publish(f"progress_channel:{task_id}", json.dumps(text_message))
+        publish_progress(task_id, text_message)
         return {"success": True, "text": text, "task_id": task_id}
     except Exception as e:
         error_message = str(e)
@@ -34,19 +89,64 @@ def create_chroma_db(self, content: Union[bytes, str], file_type: str, task_id:
         else:
             error_message = f"Error in Chroma DB creation: {error_message}"
             
-        redis_client.publish(f"progress_channel:{task_id}", 
-            json.dumps({"status": "error", "message": error_message}))
+        publish_progress(task_id, {"status": "error", "message": error_message})
         self.request.chain = None
         raise Exception(error_message)
 
-@celery_app.task(bind=True, name='app.tasks.chroma_tasks.create_document_summary')
-def create_document_summary(self, content: Union[bytes, str], file_type: str, task_id: str, user_id: str):
-    """Task to create document summary from in-memory content and notify frontend on progress"""
+@celery_app.task(bind=True, name='app.tasks.chroma_tasks.ingest_pdf_stream', priority=HIGH_PRIORITY,
+                 time_limit=INGEST_TASK_TIME_LIMIT, soft_time_limit=soft_limit(INGEST_TASK_TIME_LIMIT))
+def ingest_pdf_stream(self, blob_ref: str, task_id: str, user_id: str, document_id: str = None):
+    """Task to parse a PDF page by page, embedding pages as they arrive, then start the summary"""
     try:
-        redis_client.publish(f"progress_channel:{task_id}", "Creating compartments...")
-        
-        summary = create_document_summary_service(file_type, content)
-        title = create_title(summary)
+        publish_progress(task_id, "Splitting text into vectors...")
+
+        def start_summary():
+            create_document_summary.apply_async(args=[task_id, task_id, user_id])
+
+        # Pages go to the parsed document in Redis as they arrive; the text is read back once at the end
+        create_chroma_db_streaming(
+            iter_pdf_pages(blob_ref), user_id, task_id, publish_batch_progress(task_id), start_summary,
+            document_id or task_id, blob_ref,
+        )
+        text = load_parsed_text(task_id)
+
+        publish_progress(task_id, "Storing vectors...")
+        text_message = {
+            "status": "Storing vectors...",
+            "vectorsReady": True,
+            "text": text
+        }
+        publish_progress(task_id, text_message)
+        return {"success": True, "text": text, "task_id": task_id}
+    except Exception as e:
+        error_message = str(e)
+
+        if "Document is too large to process" in error_message:
+            error_message = "Document is too large to process."
+        else:
+            error_message = f"Error in Chroma DB creation: {error_message}"
+
+        publish_progress(task_id, {"status": "error", "message": error_message})
+        self.request.chain = None
+        raise Exception(error_message)
+
+@celery_app.task(bind=True, name='app.tasks.chroma_tasks.create_document_summary', priority=DEFAULT_PRIORITY,
+                 time_limit=SUMMARY_TASK_TIME_LIMIT, soft_time_limit=soft_limit(SUMMARY_TASK_TIME_LIMIT))
+def create_document_summary(self, parsed_key: str, task_id: str, user_id: str):
+    """Task to create document summary from a parsed document and notify frontend on progress"""
+    try:
+        parsed = load_parsed_document(parsed_key)
+
+        # The same content was summarized before: finish immediately without any LLM calls
+        cached = get_cached_summary(parsed["full_text"])
+        if cached is not None:
+            summary, title = cached["summary"], cached["title"]
+        else:
+            publish_progress(task_id, "Creating compartments...")
+
+            summary = create_document_summary_service(parsed["full_text"], parsed["num_tokens"])
+            title = create_title(summary)
+            cache_summary(parsed["full_text"], summary, title)
         
         completion_message = {
             "status": "Compartments created successfully!",
@@ -54,7 +154,7 @@ def create_document_summary(self, content: Union[bytes, str], file_type: str, ta
             "summary": summary
         }
 
-        redis_client.publish(f"progress_channel:{task_id}", json.dumps(completion_message))
+        publish_progress(task_id, completion_message)
         return {"success": True, "summary": summary, "title": title}
     except Exception as e:
         error_message = str(e)
@@ -65,17 +165,29 @@ def create_document_summary(self, content: Union[bytes, str], file_type: str, ta
         else:
             error_message = f"Error creating compartments: {error_message}"
             
-        redis_client.publish(f"progress_channel:{task_id}", 
-            json.dumps({"status": "error", "message": error_message}))
+        publish_progress(task_id, {"status": "error", "message": error_message})
         self.request.chain = None
         raise Exception(error_message)
      
-@celery_app.task(bind=True, name='app.tasks.chroma_tasks.query_chroma')
-def query_chroma(self, question: str, user_id: str):
+@celery_app.task(bind=True, name='app.tasks.chroma_tasks.query_chroma', priority=HIGH_PRIORITY,
+                 time_limit=QUERY_TASK_TIME_LIMIT, soft_time_limit=soft_limit(QUERY_TASK_TIME_LIMIT))
+def query_chroma(self, question: str, user_id: str, k: int = 3, fetch_k: int = 10, lambda_mult: float = 0.7, document_id: str = None):
     """Task to query Chroma DB for document search"""
     try:
-        response = query_chroma_service(question, user_id)
+        response = query_chroma_service(question, user_id, k, fetch_k, lambda_mult, document_id)
         return response
     except Exception as e:
         self.request.chain = None
-        raise Exception(f"Error querying Chroma DB: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Error querying Chroma DB: {str(e)}")
+
+@celery_app.task(name='app.tasks.chroma_tasks.evict_idle_collections', ignore_result=True, priority=LOW_PRIORITY)
+def evict_idle_collections():
+    """Periodic task (celery beat) evicting idle collections from Chroma"""
+    return evict_idle_collections_service()
+
+@celery_app.task(name='app.tasks.chroma_tasks.queue_probe', priority=DEFAULT_PRIORITY)
+def queue_probe(sent_at: float, work_seconds: float = 0.0) -> float:
+    """Task used by benchmarks.queue_load_test: returns how long it waited in its queue"""
+    wait = time.time() - sent_at
+    time.sleep(work_seconds)
+    return wait
@@ -0,0 +1,83 @@
+"""Concurrent load test for the chat endpoint.
+
+Fires `--requests` questions at `/chat/get-response` with at most `--concurrency`
+in flight and reports throughput and latency percentiles. Run it against the same
+server before and after a change to compare. With `--batch-size`, each request asks
+that many questions at once through `/chat/get-responses`.
+
+    RATE_LIMITS_ENABLED=false uvicorn app.main:app --port 5000
+    python -m benchmarks.chat_load_test --user-id <user with an uploaded document>
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import httpx
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def run_load_test(base_url: str, user_id: str, question: str, total: int, concurrency: int, batch_size: int = 1) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        async def send():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    if batch_size > 1:
+                        response = await client.post(
+                            "/chat/get-responses",
+                            json={"questions": [question] * batch_size, "userId": user_id},
+                        )
+                    else:
+                        response = await client.post(
+                            "/chat/get-response",
+                            json={"question": question, "userId": user_id},
+                        )
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+                except httpx.HTTPError as e:
+                    errors += 1
+                    print(f"Request failed: {e}")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(send() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "batch_size": batch_size,
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "questions_per_s": len(latencies) * batch_size / elapsed if elapsed else 0.0,
+        "latency_p50_s": percentile(latencies, 50) if latencies else None,
+        "latency_p95_s": percentile(latencies, 95) if latencies else None,
+        "latency_p99_s": percentile(latencies, 99) if latencies else None,
+        "latency_mean_s": statistics.mean(latencies) if latencies else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:5000")
+    parser.add_argument("--user-id", required=True)
+    parser.add_argument("--question", default="What is this document about?")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=1, help="questions per request")
+    args = parser.parse_args()
+
+    result = asyncio.run(run_load_test(
+        args.base_url, args.user_id, args.question, args.requests, args.concurrency, args.batch_size
+    ))
+    for key, value in result.items():
+        print(f"{key:>16}: {value:.3f}" if isinstance(value, float) else f"{key:>16}: {value}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Retrieval recall versus vector memory for the compact storage settings.
+
+Embeds a fixed corpus once at full size (cached in benchmarks/results/), then for each
+index size, with and without rescoring against a quantized copy of the full embedding,
+measures recall@k against exact full-size search, the memory per chunk in Chroma and in
+Redis, and how many collections of `--chunks-per-collection` fit in
+COLLECTION_MEMORY_BUDGET_MB. Shortened embeddings are the full ones truncated and
+renormalized, which is what the API returns for text-embedding-3 models asked for fewer
+`dimensions`. Search is exact here, so any HNSW recall loss comes on top.
+
+    python -m benchmarks.compact_vectors_benchmark --corpus ../README.md path/to/documents/*.pdf
+    python -m benchmarks.compact_vectors_benchmark --index-dimensions 256 512 --oversampling 2 4 8
+"""
+import argparse
+import hashlib
+import os
+import random
+import re
+import numpy as np
+from langchain_core.documents import Document
+from app.config import EMBEDDING_MODEL, EMBEDDING_MODEL_DIMENSIONS, COLLECTION_MEMORY_BUDGET_MB
+from app.services.collectionLifecycle import vector_bytes
+from app.services.compactVectors import truncate_embeddings, quantize, dequantize
+from app.services.createChroma import split_documents
+from app.services.parseDocument import load_pdf
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+SENTENCE_PATTERN = re.compile(r"[^.!?\n]{40,200}[.!?]")
+
+def load_corpus(paths: list[str]) -> list[Document]:
+    documents = []
+    for path in paths:
+        if path.lower().endswith(".pdf"):
+            documents += load_pdf(path)
+        else:
+            with open(path, encoding="utf-8") as f:
+                documents.append(Document(page_content=f.read(), metadata={"source": path}))
+    return split_documents(documents, 500, 150)
+
+def sample_queries(chunks: list[Document], count: int) -> list[str]:
+    """Sentences taken from the corpus, the same ones on every run."""
+    sentences = sorted({s.strip() for chunk in chunks for s in SENTENCE_PATTERN.findall(chunk.page_content)})
+    return random.Random(0).sample(sentences, min(count, len(sentences)))
+
+def embed_full(texts: list[str]) -> np.ndarray:
+    """Full-size embeddings, independent of the EMBEDDING_DIMENSIONS setting."""
+    from langchain_openai import OpenAIEmbeddings
+    embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL)
+    vectors = []
+    for start in range(0, len(texts), 100):
+        vectors += embeddings.embed_documents(texts[start:start + 100])
+    return np.asarray(vectors, dtype=np.float32)
+
+def embed_cached(texts: list[str]) -> np.ndarray:
+    digest = hashlib.sha256("\n\0".join([EMBEDDING_MODEL] + texts).encode("utf-8")).hexdigest()[:16]
+    path = os.path.join(RESULTS_DIR, f"compact-embeddings-{digest}.npy")
+    if os.path.exists(path):
+        return np.load(path)
+    vectors = embed_full(texts)
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    np.save(path, vectors)
+    return vectors
+
+def top_k(queries: np.ndarray, candidates: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the `k` most similar candidates per query, best first."""
+    scores = truncate_embeddings(queries, queries.shape[1]) @ truncate_embeddings(candidates, candidates.shape[1]).T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+def recall(found: np.ndarray, exact: np.ndarray) -> float:
+    return float(np.mean([len(set(f) & set(e)) / len(e) for f, e in zip(found, exact)]))
+
+def rescored_top_k(queries, full, index_dimensions, k, oversampling, precision, embedding_dimensions):
+    """First pass on the truncated index, then rescore the candidates with quantized full embeddings."""
+    candidates = top_k(truncate_embeddings(queries, index_dimensions), truncate_embeddings(full, index_dimensions), k * oversampling)
+    stored = truncate_embeddings(full, embedding_dimensions)
+    rescoring = np.stack([dequantize(quantize(vector, precision), precision) for vector in stored])
+    query_vectors = truncate_embeddings(queries, embedding_dimensions)
+    results = []
+    for query, ids in zip(query_vectors, candidates):
+        scores = truncate_embeddings(rescoring[ids], embedding_dimensions) @ query
+        results.append(ids[np.argsort(-scores)[:k]])
+    return np.asarray(results)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", nargs="+", default=[os.path.join("..", "README.md")], help="text, markdown or PDF files")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10, help="results compared per query (the retrieval fetch_k)")
+    parser.add_argument("--index-dimensions", type=int, nargs="+", default=[256, 512, 1024, 1536])
+    parser.add_argument("--embedding-dimensions", type=int, default=EMBEDDING_MODEL_DIMENSIONS, help="size of the rescoring copy")
+    parser.add_argument("--oversampling", type=int, nargs="+", default=[4])
+    parser.add_argument("--chunks-per-collection", type=int, default=500)
+    args = parser.parse_args()
+
+    chunks = load_corpus(args.corpus)
+    queries = sample_queries(chunks, args.queries)
+    k = min(args.k, len(chunks))
+    print(f"{len(chunks)} chunks, {len(queries)} queries, recall@{k}")
+    vectors = embed_cached([chunk.page_content for chunk in chunks] + queries)
+    full, query_vectors = vectors[:len(chunks)], vectors[len(chunks):]
+    exact = top_k(query_vectors, full, k)
+
+    budget_bytes = COLLECTION_MEMORY_BUDGET_MB * 1024 * 1024
+    baseline_bytes = vector_bytes(EMBEDDING_MODEL_DIMENSIONS)
+
+    print(f"{'index dims':>10} {'rescoring':>16} {'recall':>7} {'chroma B/chunk':>15} {'redis B/chunk':>14} {'collections':>12} {'vs full':>8}")
+    def row(index_dimensions, label, value, redis_bytes):
+        chroma_bytes = vector_bytes(index_dimensions)
+        collections = budget_bytes // (args.chunks_per_collection * chroma_bytes)
+        print(
+            f"{index_dimensions:>10} {label:>16} {value:>7.3f} {chroma_bytes:>15} {redis_bytes:>14} "
+            f"{collections:>12} {baseline_bytes / chroma_bytes:>7.1f}x"
+        )
+
+    row(EMBEDDING_MODEL_DIMENSIONS, "-", 1.0, 0)
+    for index_dimensions in sorted(args.index_dimensions, reverse=True):
+        found = top_k(truncate_embeddings(query_vectors, index_dimensions), truncate_embeddings(full, index_dimensions), k)
+        row(index_dimensions, "-", recall(found, exact), 0)
+        if index_dimensions >= args.embedding_dimensions:
+            continue
+        for precision in ("float16", "int8"):
+            redis_bytes = len(quantize(np.zeros(args.embedding_dimensions, dtype=np.float32), precision))
+            for oversampling in args.oversampling:
+                found = rescored_top_k(query_vectors, full, index_dimensions, k, oversampling, precision, args.embedding_dimensions)
+                row(index_dimensions, f"{precision} x{oversampling}", recall(found, exact), redis_bytes)
+
+if __name__ == "__main__":
+    main()
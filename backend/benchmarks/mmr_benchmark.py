@@ -0,0 +1,81 @@
+"""Microbenchmark: local vectorized MMR vs the langchain MMR used by the previous retriever.
+
+Offline mode times only the reranking step on random unit vectors. With `--user-id`,
+it also times the full retrieval against a running Chroma: the langchain Chroma
+wrapper's `max_marginal_relevance_search_by_vector` vs `mmr_search`.
+
+    python -m benchmarks.mmr_benchmark
+    python -m benchmarks.mmr_benchmark --user-id <user with an uploaded document>
+"""
+import argparse
+import statistics
+import time
+import numpy as np
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from app.services.mmrSearch import mmr_select, mmr_search
+
+FETCH_KS = [10, 50, 200]
+
+def time_call(fn, repeats: int) -> dict:
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+    }
+
+def run_offline(dimensions: int, k: int, lambda_mult: float, repeats: int):
+    rng = np.random.default_rng(0)
+    print(f"Reranking only, {dimensions} dimensions, k={k}")
+    for fetch_k in FETCH_KS:
+        query = rng.standard_normal(dimensions).astype(np.float32)
+        candidates = rng.standard_normal((fetch_k, dimensions)).astype(np.float32)
+        baseline = time_call(lambda: maximal_marginal_relevance(query, list(candidates), lambda_mult, k), repeats)
+        local = time_call(lambda: mmr_select(query, candidates, k, lambda_mult), repeats)
+        print(
+            f"  fetch_k={fetch_k:>3}  langchain p50={baseline['p50_ms']:.3f}ms p95={baseline['p95_ms']:.3f}ms"
+            f"  local p50={local['p50_ms']:.3f}ms p95={local['p95_ms']:.3f}ms"
+        )
+
+def run_live(user_id: str, question: str, k: int, lambda_mult: float, repeats: int):
+    from langchain_community.vectorstores.chroma import Chroma
+    from app.clients import get_chroma_client, get_embeddings
+    chroma_client, embeddings = get_chroma_client(), get_embeddings()
+
+    collection_name = f"user_{user_id}_docs"
+    collection = chroma_client.get_collection(name=collection_name)
+    db = Chroma(client=chroma_client, collection_name=collection_name, embedding_function=embeddings)
+    query = embeddings.embed_query(question)
+
+    print(f"End-to-end retrieval against {collection_name} ({collection.count()} chunks), k={k}")
+    for fetch_k in FETCH_KS:
+        baseline = time_call(
+            lambda: db.max_marginal_relevance_search_by_vector(query, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult),
+            repeats,
+        )
+        local = time_call(lambda: mmr_search(collection, query, k, fetch_k, lambda_mult), repeats)
+        print(
+            f"  fetch_k={fetch_k:>3}  langchain p50={baseline['p50_ms']:.1f}ms p95={baseline['p95_ms']:.1f}ms"
+            f"  local p50={local['p50_ms']:.1f}ms p95={local['p95_ms']:.1f}ms"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dimensions", type=int, default=3072)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--lambda-mult", type=float, default=0.7)
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--user-id")
+    parser.add_argument("--question", default="What is this document about?")
+    args = parser.parse_args()
+
+    run_offline(args.dimensions, args.k, args.lambda_mult, args.repeats)
+    if args.user_id:
+        run_live(args.user_id, args.question, args.k, args.lambda_mult, args.repeats)
+
+if __name__ == "__main__":
+    main()
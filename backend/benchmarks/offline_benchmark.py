@@ -0,0 +1,303 @@
+"""Offline ingest/summary/query benchmark with local stand-ins for OpenAI and Chroma.
+
+Registers deterministic fakes with configurable latency for the OpenAI embeddings and
+chat model, and an in-process EphemeralClient for Chroma, with app.clients, then drives
+`create_chroma_db`, `create_document_summary` and `query_chroma` over generated
+corpora. Only Redis must be running (caches, lexical index, generations); each run
+salts its corpus so the embedding, summary and semantic caches start cold.
+
+Results are written to benchmarks/results/ and compared against the previous run.
+Peak memory comes from tracemalloc, which slows everything down evenly; pass
+`--no-tracemalloc` for timings closer to production.
+
+    python -m benchmarks.offline_benchmark
+    python -m benchmarks.offline_benchmark --sizes 1000 10000 --embedding-latency-ms 0 --llm-latency-ms 0
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+DEFAULT_SIZES = [1000, 10000, 100000]
+# Flag a metric when it moves this much in the wrong direction
+REGRESSION_THRESHOLD = 0.10
+
+class FakeEmbeddings:
+    """Deterministic unit vectors seeded by the text hash, with a fixed per-call latency."""
+
+    def __init__(self, dimensions: int, latency_ms: float):
+        self.dimensions = dimensions
+        self.latency = latency_ms / 1000
+
+    def _vector(self, text: str) -> list[float]:
+        import numpy as np
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dimensions).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        time.sleep(self.latency)
+        return self._vector(text)
+
+class FakeChatModel:
+    """Chat model stand-in: answers with a fixed text after a fixed per-call latency."""
+
+    def __init__(self, latency_ms: float, answer_words: int):
+        self.latency = latency_ms / 1000
+        self.answer = " ".join(["lorem"] * answer_words)
+        self.prompt_tokens = []
+
+    def _record(self, prompt):
+        from app.services.tokenCount import count_tokens
+        self.prompt_tokens.append(count_tokens(str(prompt)))
+
+    def invoke(self, prompt):
+        from langchain_core.messages import AIMessage
+        self._record(prompt)
+        time.sleep(self.latency)
+        return AIMessage(content=self.answer)
+
+    def batch(self, prompts, config=None, return_exceptions=False):
+        max_concurrency = (config or {}).get("max_concurrency") or len(prompts) or 1
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            return list(executor.map(self.invoke, prompts))
+
+    def stream(self, prompt):
+        from langchain_core.messages import AIMessageChunk
+        self._record(prompt)
+        time.sleep(self.latency)
+        for word in self.answer.split(" "):
+            yield AIMessageChunk(content=word + " ")
+
+def install_fakes(args):
+    """Register the stand-ins with the client registry before anything asks for the real clients."""
+    import chromadb
+    from chromadb.config import Settings
+    os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+    from app.clients import get_chroma_client, get_embeddings, get_llm
+
+    chroma_client = chromadb.EphemeralClient(settings=Settings(anonymized_telemetry=False))
+    get_chroma_client.override(chroma_client)
+    get_embeddings.override(FakeEmbeddings(args.dimensions, args.embedding_latency_ms))
+    get_llm.override(FakeChatModel(args.llm_latency_ms, args.answer_words))
+    return chroma_client
+
+def generate_corpus(num_tokens: int, salt: str, count_tokens, page_tokens: int = 800) -> tuple[list, str, list[str]]:
+    """Build pages of pseudo-English text, the same for every run apart from the salt line."""
+    from langchain_core.documents import Document
+    rng = random.Random(num_tokens)
+    vocabulary = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 9))) for _ in range(5000)]
+    pages, total_tokens = [], 0
+    while total_tokens < num_tokens:
+        text, tokens = f"Benchmark run {salt}.\n", 0
+        while tokens < min(page_tokens, num_tokens - total_tokens):
+            sentence = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(8, 24))).capitalize() + ". "
+            text += sentence
+            tokens += count_tokens(sentence)
+        total_tokens += tokens
+        pages.append(Document(page_content=text, metadata={"source": f"corpus_{num_tokens}", "page": len(pages)}))
+    return pages, "\n\n".join(page.page_content for page in pages), vocabulary
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class StageTimer:
+    """Wall time and, when tracemalloc is on, peak traced memory of one stage."""
+
+    def __enter__(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+        self.peak_mb = tracemalloc.get_traced_memory()[1] / 1e6 if tracemalloc.is_tracing() else None
+
+def run_size(num_tokens: int, args, run_salt: str) -> dict:
+    from app.services.createChroma import create_chroma_db
+    from app.services.createSummary import create_document_summary, SUMMARY_ERROR_PREFIX
+    from app.services.queryChroma import query_chroma, query_chroma_batch, QUERY_ERROR_ANSWER
+    from app.services.tokenCount import count_tokens
+    from app.clients import get_llm
+
+    pages, full_text, vocabulary = generate_corpus(num_tokens, run_salt, count_tokens)
+    user_id = f"bench_{run_salt}_{num_tokens}"
+    counted_tokens = count_tokens(full_text)
+    print(f"\n{num_tokens} token corpus: {len(pages)} pages, {counted_tokens} tokens counted")
+
+    with StageTimer() as ingest:
+        chunks = create_chroma_db(pages, user_id)
+    print(f"  ingest   {ingest.seconds:.2f}s  {chunks} chunks")
+
+    with StageTimer() as summary:
+        summary_text = create_document_summary(full_text, counted_tokens)
+    if summary_text.startswith(SUMMARY_ERROR_PREFIX):
+        raise RuntimeError(summary_text)
+    print(f"  summary  {summary.seconds:.2f}s")
+
+    rng = random.Random(num_tokens)
+    questions = [f"{run_salt} what about {' '.join(rng.sample(vocabulary, 3))}?" for _ in range(args.queries)]
+    latencies, errors = [], 0
+    llm = get_llm()
+    llm.prompt_tokens.clear()
+    with StageTimer() as query:
+        for question in questions:
+            start = time.perf_counter()
+            result = query_chroma(question, user_id)
+            latencies.append((time.perf_counter() - start) * 1000)
+            errors += result["answer"] == QUERY_ERROR_ANSWER
+    prompt_tokens = statistics.mean(llm.prompt_tokens) if llm.prompt_tokens else 0
+    print(
+        f"  query    p50={percentile(latencies, 0.5):.1f}ms p95={percentile(latencies, 0.95):.1f}ms "
+        f"prompt={prompt_tokens:.0f} tokens errors={errors}"
+    )
+
+    # New questions, so the semantic cache doesn't answer them
+    batch_questions = [f"{run_salt} and {' '.join(rng.sample(vocabulary, 3))}?" for _ in range(args.queries)]
+    batch_errors = 0
+    with StageTimer() as batch:
+        for start in range(0, len(batch_questions), args.batch_size):
+            results = query_chroma_batch(batch_questions[start:start + args.batch_size], user_id)
+            batch_errors += sum(result["answer"] == QUERY_ERROR_ANSWER for result in results)
+    print(
+        f"  batch    {len(batch_questions) / batch.seconds:.1f} questions/s in batches of {args.batch_size} "
+        f"(one by one {len(questions) / query.seconds:.1f}/s) errors={batch_errors}"
+    )
+
+    cleanup_user(user_id)
+    return {
+        "tokens": counted_tokens,
+        "pages": len(pages),
+        "chunks": chunks,
+        "ingest_seconds": ingest.seconds,
+        "ingest_tokens_per_second": counted_tokens / ingest.seconds,
+        "ingest_chunks_per_second": chunks / ingest.seconds,
+        "ingest_peak_mb": ingest.peak_mb,
+        "summary_seconds": summary.seconds,
+        "summary_tokens_per_second": counted_tokens / summary.seconds,
+        "summary_peak_mb": summary.peak_mb,
+        "query_p50_ms": percentile(latencies, 0.5),
+        "query_p95_ms": percentile(latencies, 0.95),
+        "query_p99_ms": percentile(latencies, 0.99),
+        "query_mean_ms": statistics.mean(latencies),
+        "query_per_second": len(questions) / query.seconds,
+        "query_peak_mb": query.peak_mb,
+        "query_errors": errors,
+        "query_prompt_tokens": prompt_tokens,
+        "query_batch_per_second": len(batch_questions) / batch.seconds,
+        "query_batch_errors": batch_errors,
+    }
+
+def cleanup_user(user_id: str):
+    from app.clients import get_chroma_client, get_redis
+    from app.services.collectionState import forget_collection
+    from app.services.lexicalIndex import delete_lexical_index
+    try:
+        get_chroma_client().delete_collection(name=f"user_{user_id}_docs")
+    except Exception:
+        pass
+    delete_lexical_index(user_id)
+    forget_collection(user_id)
+    get_redis().delete(f"collection_generation:{user_id}")
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return "unknown"
+
+def previous_result(settings: dict):
+    """Most recent saved run with the same settings, so the comparison is like for like."""
+    for path in sorted(glob.glob(os.path.join(RESULTS_DIR, "offline-*.json")), reverse=True):
+        with open(path) as f:
+            result = json.load(f)
+        if result.get("settings") == settings:
+            return path, result
+    return None, None
+
+def compare(current: dict, previous: dict):
+    for size, metrics in current["sizes"].items():
+        before = previous["sizes"].get(size)
+        if not before:
+            continue
+        print(f"\n{size} tokens vs previous run")
+        for name, value in metrics.items():
+            old = before.get(name)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+                continue
+            if not name.endswith(("_seconds", "_ms", "_mb", "_per_second", "_tokens")):
+                continue
+            change = (value - old) / old
+            # Throughput regresses when it drops, everything else when it grows
+            worse = -change if name.endswith("_per_second") else change
+            flag = "  REGRESSION" if worse > REGRESSION_THRESHOLD else ""
+            print(f"  {name:<28} {old:>12.2f} -> {value:>12.2f} ({change:+.1%}){flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="corpus sizes in tokens")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--dimensions", type=int, default=3072)
+    parser.add_argument("--embedding-latency-ms", type=float, default=150)
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--answer-words", type=int, default=120)
+    parser.add_argument("--batch-size", type=int, default=10, help="questions per query_chroma_batch call")
+    parser.add_argument("--no-tracemalloc", action="store_true")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    install_fakes(args)
+    from app.clients import get_redis
+    get_redis().ping()
+
+    settings = {
+        "sizes": args.sizes,
+        "queries": args.queries,
+        "dimensions": args.dimensions,
+        "embedding_latency_ms": args.embedding_latency_ms,
+        "llm_latency_ms": args.llm_latency_ms,
+        "answer_words": args.answer_words,
+        "batch_size": args.batch_size,
+        "tracemalloc": not args.no_tracemalloc,
+    }
+    if settings["tracemalloc"]:
+        tracemalloc.start()
+
+    run_salt = uuid.uuid4().hex[:8]
+    result = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "settings": settings,
+        "sizes": {str(size): run_size(size, args, run_salt) for size in args.sizes},
+    }
+
+    previous_path, previous = previous_result(settings)
+    if previous:
+        print(f"\nComparing with {os.path.basename(previous_path)} (commit {previous.get('commit')})")
+        compare(result, previous)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"offline-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json")
+        with open(path, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nSaved {path}")
+
+if __name__ == "__main__":
+    main()
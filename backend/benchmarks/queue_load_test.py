@@ -0,0 +1,61 @@
+"""Queue wait times per workload class under a mixed Celery workload.
+
+Sends probe tasks that sleep for a typical task duration to the ingest, summary and
+query queues with the priorities of the real tasks: a burst of long summaries first,
+then ingest and query work arriving steadily behind it. Each probe reports how long
+it sat in its queue before a worker picked it up. Needs Redis and the workers running
+as described in the README; compare against a single worker consuming every queue.
+
+    python -m benchmarks.queue_load_test
+    python -m benchmarks.queue_load_test --summaries 8 --summary-seconds 30
+"""
+import argparse
+import statistics
+import time
+from app.tasks.celery_config import INGEST_QUEUE, SUMMARY_QUEUE, QUERY_QUEUE, HIGH_PRIORITY, DEFAULT_PRIORITY
+from app.tasks.chroma_tasks import queue_probe
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def send_probe(queue: str, priority: int, work_seconds: float):
+    return queue_probe.apply_async(args=[time.time(), work_seconds], queue=queue, priority=priority)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--summaries", type=int, default=6)
+    parser.add_argument("--summary-seconds", type=float, default=20)
+    parser.add_argument("--ingests", type=int, default=12)
+    parser.add_argument("--ingest-seconds", type=float, default=3)
+    parser.add_argument("--queries", type=int, default=30)
+    parser.add_argument("--query-seconds", type=float, default=0.5)
+    parser.add_argument("--interval", type=float, default=0.25, help="seconds between ingest/query arrivals")
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    sent = {"summary": [], "ingest": [], "query": []}
+    for _ in range(args.summaries):
+        sent["summary"].append(send_probe(SUMMARY_QUEUE, DEFAULT_PRIORITY, args.summary_seconds))
+
+    # Ingest and query work keeps arriving behind the summaries
+    for index in range(max(args.ingests, args.queries)):
+        if index < args.ingests:
+            sent["ingest"].append(send_probe(INGEST_QUEUE, HIGH_PRIORITY, args.ingest_seconds))
+        if index < args.queries:
+            sent["query"].append(send_probe(QUERY_QUEUE, HIGH_PRIORITY, args.query_seconds))
+        time.sleep(args.interval)
+
+    print(f"{'class':<8} {'tasks':>5} {'p50 wait':>10} {'p95 wait':>10} {'max wait':>10}")
+    deadline = time.time() + args.timeout
+    for kind, results in sent.items():
+        if not results:
+            continue
+        waits = [result.get(timeout=max(1, deadline - time.time())) for result in results]
+        print(
+            f"{kind:<8} {len(waits):>5} {statistics.median(waits):>9.2f}s "
+            f"{percentile(waits, 0.95):>9.2f}s {max(waits):>9.2f}s"
+        )
+
+if __name__ == "__main__":
+    main()
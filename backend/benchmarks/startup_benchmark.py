@@ -0,0 +1,87 @@
+"""Cold start time of the API and the Celery worker modules.
+
+Imports `app.main` (what uvicorn loads) and `app.tasks` (what `celery -A app.tasks.celery_config`
+loads) in fresh interpreters and reports the import time. With `--ref`, the same is
+measured on another commit checked out in a temporary git worktree, e.g. the commit
+before the lazy client registry. Older commits connect to Chroma at import time, so
+run Chroma and Redis when comparing against them.
+
+    python -m benchmarks.startup_benchmark
+    python -m benchmarks.startup_benchmark --ref HEAD~1 --importtime
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+TARGETS = {"api": "app.main", "worker": "app.tasks"}
+
+MEASURE = "import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+
+def measure(module: str, cwd: str, repeats: int) -> list[float]:
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    env.setdefault("OPENAI_API_KEY", "startup-benchmark")
+    timings = []
+    for _ in range(repeats):
+        result = subprocess.run(
+            [sys.executable, "-c", MEASURE.format(module=module)],
+            cwd=cwd, env=env, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return timings
+
+def slowest_imports(module: str, cwd: str, top: int) -> list[tuple[int, str]]:
+    """Top imports by cumulative time from `python -X importtime`."""
+    env = dict(os.environ, OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "startup-benchmark"))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=cwd, env=env, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].rstrip()))
+    # Only top-level packages, so nested imports don't repeat their parents' time
+    rows = [(micros, name.strip()) for micros, name in rows if not name.startswith("   ")]
+    return sorted(rows, reverse=True)[:top]
+
+def report(label: str, cwd: str, repeats: int, importtime: bool):
+    print(label)
+    for target, module in TARGETS.items():
+        try:
+            timings = measure(module, cwd, repeats)
+        except RuntimeError as e:
+            print(f"  {target:<7} import {module} failed: {e}")
+            continue
+        print(f"  {target:<7} median={statistics.median(timings) * 1000:.0f}ms  min={min(timings) * 1000:.0f}ms")
+        if importtime:
+            for micros, name in slowest_imports(module, cwd, 8):
+                print(f"            {micros / 1000:>7.0f}ms  {name}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--ref", help="git commit to compare against")
+    parser.add_argument("--importtime", action="store_true", help="list the slowest imports")
+    args = parser.parse_args()
+
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    report("Working tree", backend_dir, args.repeats, args.importtime)
+
+    if args.ref:
+        repo_root = subprocess.check_output(["git", "rev-parse", "--show-toplevel"], cwd=backend_dir, text=True).strip()
+        worktree = tempfile.mkdtemp(prefix="startup-benchmark-")
+        subprocess.run(["git", "worktree", "add", "--detach", worktree, args.ref], cwd=repo_root, check=True, capture_output=True)
+        try:
+            # Keep using this checkout's .env
+            if os.path.exists(os.path.join(backend_dir, ".env")):
+                shutil.copy(os.path.join(backend_dir, ".env"), os.path.join(worktree, "backend", ".env"))
+            report(args.ref, os.path.join(worktree, "backend"), args.repeats, args.importtime)
+        finally:
+            subprocess.run(["git", "worktree", "remove", "--force", worktree], cwd=repo_root, capture_output=True)
+
+if __name__ == "__main__":
+    main()
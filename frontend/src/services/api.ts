@@ -41,6 +41,29 @@ export const uploadDocument = async (file: File, onProgressUpdate: (progress: nu
       let currentProgress = 20;
       const processedMessages = new Set();
       let documentText = '';
+      // The vectors and the summary are built by separate tasks and may finish in either order
+      let vectorsReady = false;
+      let summaryMessage: any = null;
+      let finished = false;
+
+      const finish = () => {
+        finished = true;
+        currentProgress = 100;
+        onProgressUpdate(currentProgress, summaryMessage.status);
+
+        setTimeout(() => {
+          onReady(true);
+        }, 1000);
+
+        eventSource.close();
+        resolve({
+          ...response.data,
+          userId: userId,
+          summary: summaryMessage.summary,
+          title: summaryMessage.title,
+          text: documentText
+        });
+      };
       
       eventSource.onmessage = (event) => {
         let message = event.data;
@@ -58,31 +81,33 @@ export const uploadDocument = async (file: File, onProgressUpdate: (progress: nu
           }
 
           if (jsonMessage.status && jsonMessage.summary && jsonMessage.title) {
-            // This is our summary completion message
-            currentProgress = 100;
-            onProgressUpdate(currentProgress, jsonMessage.status);
-
-            setTimeout(() => {
-              onReady(true);
-            }, 1000);
-
-            eventSource.close();
-            resolve({
-              ...response.data,
-              userId: userId,
-              summary: jsonMessage.summary,
-              title: jsonMessage.title,
-              text: documentText
-            });
+            // Summary completion message; the document is ready once its vectors are stored too
+            summaryMessage = jsonMessage;
+            if (vectorsReady) {
+              finish();
+            }
             return;
           }
-          if (jsonMessage.status && jsonMessage.text) {
-            // Store the document text
+          if (jsonMessage.status && jsonMessage.batches) {
+            // Per-batch embedding progress, fills the step before "Storing vectors..."
+            const batchProgress = Math.round((20 * jsonMessage.batch) / jsonMessage.batches);
+            onProgressUpdate(Math.min(currentProgress + batchProgress, 100), jsonMessage.status);
+            return;
+          }
+          if (jsonMessage.status && jsonMessage.vectorsReady) {
+            // Vectors are stored; the message also carries the document text
             documentText = jsonMessage.text;
+            vectorsReady = true;
+            if (summaryMessage) {
+              finish();
+              return;
+            }
             onProgressUpdate(currentProgress, jsonMessage.status);
 
             setTimeout(() => {
-              onProgressUpdate(currentProgress, "Creating compartments...");
+              if (!finished) {
+                onProgressUpdate(currentProgress, "Creating compartments...");
+              }
             }, 2500);
             
             return;
@@ -131,7 +156,7 @@ export const uploadDocument = async (file: File, onProgressUpdate: (progress: nu
       throw new Error("Server took too long to respond");
     } else if (error.status === 429) {
       throw new Error("Rate limit exceeded");
-    } else if (error.message === "Document is too large to process.") {
+    } else if (error.response?.status === 413 || error.message === "Document is too large to process.") {
       throw new Error("Document is too large to process");
     } else {
       // Pass the specific error message from the server
@@ -162,6 +187,29 @@ export const uploadText = async (textContent: string, onProgressUpdate: (progres
       let currentProgress = 20;
       const processedMessages = new Set();
       let documentText = '';
+      // The vectors and the summary are built by separate tasks and may finish in either order
+      let vectorsReady = false;
+      let summaryMessage: any = null;
+      let finished = false;
+
+      const finish = () => {
+        finished = true;
+        currentProgress = 100;
+        onProgressUpdate(currentProgress, summaryMessage.status);
+
+        setTimeout(() => {
+          onReady(true);
+        }, 1000);
+
+        eventSource.close();
+        resolve({
+          ...response.data,
+          userId: userId,
+          summary: summaryMessage.summary,
+          title: summaryMessage.title,
+          text: documentText
+        });
+      };
       
       eventSource.onmessage = (event) => {
         let message = event.data;
@@ -171,31 +219,33 @@ export const uploadText = async (textContent: string, onProgressUpdate: (progres
           // Try to parse the message as JSON
           const jsonMessage = JSON.parse(message);
           if (jsonMessage.status && jsonMessage.summary && jsonMessage.title) {
-            // This is our summary completion message
-            currentProgress = 100;
-            onProgressUpdate(currentProgress, jsonMessage.status);
-
-            setTimeout(() => {
-              onReady(true);
-            }, 1000);
-
-            eventSource.close();
-            resolve({
-              ...response.data,
-              userId: userId,
-              summary: jsonMessage.summary,
-              title: jsonMessage.title,
-              text: documentText
-            });
+            // Summary completion message; the document is ready once its vectors are stored too
+            summaryMessage = jsonMessage;
+            if (vectorsReady) {
+              finish();
+            }
             return;
           }
-          if (jsonMessage.status && jsonMessage.text) {
-            // Store the document text
+          if (jsonMessage.status && jsonMessage.batches) {
+            // Per-batch embedding progress, fills the step before "Storing vectors..."
+            const batchProgress = Math.round((20 * jsonMessage.batch) / jsonMessage.batches);
+            onProgressUpdate(Math.min(currentProgress + batchProgress, 100), jsonMessage.status);
+            return;
+          }
+          if (jsonMessage.status && jsonMessage.vectorsReady) {
+            // Vectors are stored; the message also carries the document text
             documentText = jsonMessage.text;
+            vectorsReady = true;
+            if (summaryMessage) {
+              finish();
+              return;
+            }
             onProgressUpdate(currentProgress, jsonMessage.status);
 
             setTimeout(() => {
-              onProgressUpdate(currentProgress, "Creating compartments...");
+              if (!finished) {
+                onProgressUpdate(currentProgress, "Creating compartments...");
+              }
             }, 2500);
             
             return;
@@ -246,7 +296,7 @@ export const uploadText = async (textContent: string, onProgressUpdate: (progres
     else if (error.status === 429) {
       throw new Error("Rate limit exceeded");
     }
-    else if (error.message === "Document is too large to process.") {
+    else if (error.response?.status === 413 || error.message === "Document is too large to process.") {
       throw new Error("Text is too long to process.");
     } else {
       throw new Error("Failed to process the text");